@@ -0,0 +1,58 @@
+import json
+
+
+def add_arguments(parser):
+    """
+    Add the options every benchmark shares, for saving results and comparing
+    against them later.
+    """
+
+    parser.add_argument("--save", metavar="FILE", help="save the results as json")
+    parser.add_argument(
+        "--baseline", metavar="FILE", help="compare against previously saved results"
+    )
+
+
+def report(args, results, title, columns, notes=None):
+    """
+    Print results as a table, one row per scenario, and save them if asked.
+
+    Each column is a (heading, width, format) tuple, where format turns a
+    result into the cell's text. notes is given each result along with its
+    baseline (or None), and returns anything to add to the end of its row,
+    such as how it has changed.
+    """
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    width = max([len(title), *(len(scenario) for scenario in results)])
+    print(
+        f"{title:<{width}}"
+        + "".join(f" {heading:>{size}}" for heading, size, _ in columns)
+    )
+    for scenario, result in results.items():
+        line = f"{scenario:<{width}}" + "".join(
+            f" {format(result):>{size}}" for _, size, format in columns
+        )
+        if notes is not None:
+            for note in notes(result, baseline.get(scenario)):
+                line += f"  {note}"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def change(result, base, key):
+    """
+    Relative change of a measurement from its baseline, or None if there's
+    nothing to compare against.
+    """
+
+    if base is None or not base.get(key):
+        return None
+    return (result[key] - base[key]) / base[key]
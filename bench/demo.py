@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import common
+import ctftool
+
+DEMO = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "challenges", "demo"
+)
+
+# how the demo template can be served: flask's development server (as it
+# used to be), and gunicorn as configured for its container
+SERVERS = {
+    "flask": [sys.executable, "app.py"],
+    "gunicorn": [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "--config",
+        "gunicorn.conf.py",
+        "app:app",
+    ],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="measure the requests/sec the demo web challenge sustains"
+    )
+    parser.add_argument(
+        "--server",
+        choices=list(SERVERS),
+        nargs="+",
+        default=list(SERVERS),
+        help="servers to benchmark the demo with",
+    )
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        nargs="+",
+        default=[1, 8, 32, 128],
+        help="numbers of concurrent connections to benchmark with",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10, help="seconds to hold each step for"
+    )
+    parser.add_argument("--path", default="/flag", help="path to request")
+    common.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    for server in args.server:
+        results.update(run(server, args.concurrency, args.duration, args.path))
+
+    common.report(args, results, "scenario", COLUMNS, notes)
+
+
+def run(server, concurrencies, duration, path):
+    port = free_port()
+    env = {**os.environ, "PORT": str(port)}
+    proc = subprocess.Popen(
+        SERVERS[server],
+        cwd=DEMO,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        target = ctftool.ProbeTarget("demo", "127.0.0.1", port, path)
+        wait_ready(target, proc)
+
+        results = {}
+        for concurrency in concurrencies:
+            stage = asyncio.run(ctftool.run_load(target, concurrency, duration))
+            results[f"{server} (c={concurrency})"] = stage
+        return results
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(target, proc, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        if asyncio.run(ctftool.probe_once(target, timeout=1)).ok:
+            return
+        time.sleep(0.1)
+    raise RuntimeError("server did not become ready")
+
+
+COLUMNS = [
+    ("req/s", 9, lambda result: f"{result['throughput']:.1f}"),
+    ("errors", 7, lambda result: f"{result['error_rate']:.1%}"),
+    ("p50", 9, lambda result: ctftool.format_latency(result["latency_p50"])),
+    ("p99", 9, lambda result: ctftool.format_latency(result["latency_p99"])),
+]
+
+
+def notes(result, base):
+    if (throughput := common.change(result, base, "throughput")) is not None:
+        yield f"{throughput:+.0%} req/s"
+
+
+if __name__ == "__main__":
+    main()
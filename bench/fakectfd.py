@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+import argparse
+import email.parser
+import hashlib
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+import ctftool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run a fake CTFd API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", "-p", type=int, default=8000)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="mean latency to add in seconds"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="fraction of requests to fail with a 502",
+    )
+    parser.add_argument(
+        "--no-sha1",
+        action="store_true",
+        help="don't report file hashes, like CTFd before 3.5",
+    )
+    args = parser.parse_args()
+
+    server = FakeCTFd(
+        (args.host, args.port),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        sha1=not args.no_sha1,
+    )
+    print(f"serving on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+class FakeCTFd(http.server.ThreadingHTTPServer):
+    """
+    In-memory stand-in for the parts of the CTFd API that ctftool uses.
+
+    Latency and errors can be injected, to approximate a real (or struggling)
+    server, and every request is counted, so that clients can be measured.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0, error_rate=0, sha1=True):
+        super().__init__(address, Handler)
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.sha1 = sha1
+
+        self.lock = threading.Lock()
+        self.ids = 0
+        self.challenges = {}
+        self.flags = {}
+        self.hints = {}
+        self.files = {}
+
+        self.requests = 0
+        self.writes = 0
+        self.bytes_received = 0
+        self.endpoints = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def next_id(self):
+        self.ids += 1
+        return self.ids
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "writes": self.writes,
+                "bytes_received": self.bytes_received,
+                "endpoints": dict(self.endpoints),
+            }
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # headers and body are written separately, so avoid waiting on acks for
+    # the headers before sending the body
+    disable_nagle_algorithm = True
+
+    ROUTES = [
+        ("GET", r"/api/v1/challenges", "list_challenges"),
+        ("POST", r"/api/v1/challenges", "create_challenge"),
+        ("GET", r"/api/v1/challenges/(\d+)", "get_challenge"),
+        ("PATCH", r"/api/v1/challenges/(\d+)", "update_challenge"),
+        ("GET", r"/api/v1/challenges/(\d+)/requirements", "get_requirements"),
+        ("GET", r"/api/v1/challenges/(\d+)/(flags|hints|files)", "list_parts"),
+        ("POST", r"/api/v1/(flags|hints)", "create_part"),
+        ("POST", r"/api/v1/files", "create_file"),
+        ("DELETE", r"/api/v1/(flags|hints|files)/(\d+)", "delete_part"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+
+        server = self.server
+        path = self.path.split("?")[0]
+        with server.lock:
+            server.requests += 1
+            server.bytes_received += length
+            if method != "GET":
+                server.writes += 1
+            endpoint = ctftool.Metrics.endpoint(method, path)
+            server.endpoints[endpoint] = server.endpoints.get(endpoint, 0) + 1
+
+        if server.latency:
+            time.sleep(random.uniform(0.5, 1.5) * server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            return self.respond(502, {"success": False})
+        if not self.headers.get("Authorization", "").startswith("Token "):
+            return self.respond(403, {"success": False})
+
+        for route_method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with server.lock:
+                    status, data = getattr(self, name)(body, *match.groups())
+                return self.respond(status, {"success": status < 400, "data": data})
+
+        self.respond(404, {"success": False})
+
+    def respond(self, status, data):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def list_challenges(self, body):
+        summary = ("id", "type", "name", "value", "category")
+        return 200, [
+            {key: chal[key] for key in summary}
+            for chal in self.server.challenges.values()
+        ]
+
+    def create_challenge(self, body):
+        data = json.loads(body)
+        chal = {
+            "id": self.server.next_id(),
+            "type": data.get("type", "standard"),
+            "name": data["name"],
+            "value": data.get("value", 0),
+            "category": data.get("category", ""),
+            "description": data.get("description", ""),
+            "state": data.get("state", "visible"),
+            "requirements": None,
+        }
+        self.server.challenges[chal["id"]] = chal
+        return 200, chal
+
+    def get_challenge(self, body, challenge_id):
+        chal = self.server.challenges.get(int(challenge_id))
+        if chal is None:
+            return 404, None
+        return 200, {k: v for k, v in chal.items() if k != "requirements"}
+
+    def update_challenge(self, body, challenge_id):
+        chal = self.server.challenges.get(int(challenge_id))
+        if chal is None:
+            return 404, None
+        chal.update(json.loads(body))
+        return 200, chal
+
+    def get_requirements(self, body, challenge_id):
+        chal = self.server.challenges.get(int(challenge_id))
+        if chal is None:
+            return 404, None
+        return 200, chal["requirements"]
+
+    def list_parts(self, body, challenge_id, kind):
+        parts = getattr(self.server, kind).values()
+        return 200, [
+            {k: v for k, v in part.items() if k != "challenge_id"}
+            for part in parts
+            if part["challenge_id"] == int(challenge_id)
+        ]
+
+    def create_part(self, body, kind):
+        data = json.loads(body)
+        part = {
+            "id": self.server.next_id(),
+            "challenge_id": int(data.pop("challenge")),
+            **data,
+        }
+        if kind == "flags":
+            part.setdefault("type", "static")
+        else:
+            part.setdefault("type", "standard")
+        getattr(self.server, kind)[part["id"]] = part
+        return 200, part
+
+    def create_file(self, body):
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+        )
+        fields = {}
+        uploads = []
+        for part in message.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            filename = part.get_filename()
+            content = part.get_payload(decode=True)
+            if filename is None:
+                fields[name] = content.decode()
+            else:
+                uploads.append((filename, content))
+
+        files = []
+        for filename, content in uploads:
+            location = f"{uuid.uuid4().hex}/{ctftool.secure_filename(filename)}"
+            file = {
+                "id": self.server.next_id(),
+                "challenge_id": int(fields["challenge"]),
+                "type": fields.get("type", "standard"),
+                "location": location,
+            }
+            if self.server.sha1:
+                file["sha1sum"] = hashlib.sha1(content).hexdigest()
+            self.server.files[file["id"]] = file
+            files.append({k: v for k, v in file.items() if k != "challenge_id"})
+        return 200, files
+
+    def delete_part(self, body, kind, part_id):
+        if getattr(self.server, kind).pop(int(part_id), None) is None:
+            return 404, None
+        return 200, None
+
+
+if __name__ == "__main__":
+    main()
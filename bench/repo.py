@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import common
+import ctftool
+import synth
+
+DEPLOY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "deploy")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="benchmark loading, validating and generating a large repo"
+    )
+    parser.add_argument(
+        "--count",
+        "-n",
+        type=int,
+        nargs="+",
+        default=[100, 1000],
+        help="numbers of challenges to benchmark with",
+    )
+    parser.add_argument(
+        "--git",
+        action="store_true",
+        help="commit the synthetic repo, so that git hashes are resolved",
+    )
+    common.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    for count in args.count:
+        for step, result in run(count, args.git).items():
+            results[f"{step} (n={count})"] = result
+
+    common.report(args, results, "step", COLUMNS, notes)
+
+
+def run(count, git=False):
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        synth.synthesize(root, count, file_size=64)
+        if git:
+            commit(root)
+
+        # work on copies of the generators, as they write their output next
+        # to themselves
+        shutil.copytree(DEPLOY, os.path.join(root, "deploy"))
+        kube = load_module(os.path.join(root, "deploy", "kube", "challenges.py"))
+        compose = load_module(
+            os.path.join(root, "deploy", "docker-compose", "docker-compose.override.py")
+        )
+
+        steps = {
+            "list (cold)": (lambda: command("list"), clear_cache),
+            "list (warm)": (lambda: command("list"), None),
+            "validate (cold)": (lambda: command("validate"), clear_cache),
+            "validate (warm)": (lambda: command("validate"), None),
+            "kube": (kube.main, None),
+            "compose": (lambda: compose.main([]), None),
+        }
+
+        try:
+            os.chdir(root)
+            for step, (func, setup) in steps.items():
+                results[step] = measure(func, setup, count)
+        finally:
+            os.chdir(cwd)
+
+    return results
+
+
+def measure(func, setup, count):
+    """
+    Time a function, and then run it again to find its peak memory usage (as
+    tracing allocations distorts the timings).
+    """
+
+    if setup:
+        setup()
+    start = time.perf_counter()
+    quietly(func)
+    elapsed = time.perf_counter() - start
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        quietly(func)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_time": elapsed,
+        "throughput": count / elapsed if elapsed else 0,
+        "peak_memory": peak,
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def command(name):
+    args = ctftool.build_parser().parse_args([name])
+    return args.func(args)
+
+
+def quietly(func):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func()
+
+
+def clear_cache():
+    shutil.rmtree(ctftool.CACHE_DIR, ignore_errors=True)
+
+
+def commit(root):
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "bench",
+        "GIT_AUTHOR_EMAIL": "bench@localhost",
+        "GIT_COMMITTER_NAME": "bench",
+        "GIT_COMMITTER_EMAIL": "bench@localhost",
+    }
+    for command in (["init", "-q"], ["add", "."], ["commit", "-q", "-m", "synth"]):
+        subprocess.run(["git", *command], cwd=root, env=env, check=True)
+
+
+def load_module(path):
+    name = os.path.splitext(os.path.basename(path))[0].replace(".", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+COLUMNS = [
+    ("wall", 9, lambda result: f"{result['wall_time']:.3f}s"),
+    ("chal/s", 9, lambda result: f"{result['throughput']:.0f}"),
+    ("peak mem", 10, lambda result: ctftool.format_bytes(result["peak_memory"])),
+    ("max rss", 10, lambda result: ctftool.format_bytes(result["max_rss"])),
+]
+
+
+def notes(result, base):
+    if (wall := common.change(result, base, "wall_time")) is not None:
+        yield f"{wall:+.0%} wall"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CTFTOOL = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "ctftool.py"
+)
+
+# modules that local commands should never need to load (ctypes isn't
+# included, as colorama always imports it)
+FORBIDDEN = ["requests", "urllib3", "yaml", "multiprocessing", "concurrent"]
+
+# and those that merely importing ctftool shouldn't, as only some commands
+# need them
+FORBIDDEN_IMPORT = FORBIDDEN + [
+    "asyncio",
+    "hashlib",
+    "random",
+    "select",
+    "struct",
+    "subprocess",
+    "threading",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="measure (and guard) the startup time of ctftool"
+    )
+    parser.add_argument("--runs", "-n", type=int, default=10)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        help="maximum time allowed to import ctftool itself (timings vary too "
+        "much between hosts to check this by default)",
+    )
+    args = parser.parse_args()
+
+    ok = True
+
+    # anything the interpreter loads by itself (through site, for example)
+    # isn't ctftool's doing
+    baseline = imported_modules([sys.executable, "-X", "importtime", "-c", "pass"])
+
+    # the import of ctftool itself, excluding the interpreter's startup
+    times = [import_time("ctftool") for _ in range(args.runs)]
+    median = statistics.median(times) / 1000
+    print(f"{'import ctftool':<24} {median:>8.1f}ms")
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"  over budget of {args.budget_ms:.1f}ms")
+        ok = False
+
+    loaded = imported_modules(
+        [sys.executable, "-X", "importtime", "-c", "import ctftool"]
+    )
+    forbidden = [m for m in FORBIDDEN_IMPORT if m in loaded and m not in baseline]
+    if forbidden:
+        print(f"  loaded {', '.join(forbidden)}")
+        ok = False
+
+    # whole local commands, run against the repo in the working directory
+    # (warming the caches first, as hooks would find them)
+    for command in (["list"], ["validate"]):
+        run([sys.executable, CTFTOOL, *command])
+
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            run([sys.executable, CTFTOOL, *command])
+            times.append(time.perf_counter() - start)
+        median = statistics.median(times) * 1000
+        print(f"{' '.join(['ctftool.py', *command]):<24} {median:>8.1f}ms")
+
+        loaded = imported_modules(
+            [sys.executable, "-X", "importtime", CTFTOOL, *command]
+        )
+        forbidden = [m for m in FORBIDDEN if m in loaded and m not in baseline]
+        if forbidden:
+            print(f"  loaded {', '.join(forbidden)}")
+            ok = False
+
+    if not ok:
+        sys.exit(1)
+
+
+def import_time(module):
+    """
+    Cumulative time (in microseconds) to import a module, as reported by
+    python -X importtime.
+    """
+
+    proc = run([sys.executable, "-X", "importtime", "-c", f"import {module}"])
+    for line in proc.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise RuntimeError(f"could not find import time of {module}")
+
+
+def imported_modules(command):
+    proc = run(command)
+    modules = set()
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and line.startswith("import time:"):
+            modules.add(parts[2].strip().split(".")[0])
+    return modules
+
+
+def run(command):
+    return subprocess.run(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+
+import yaml
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate a synthetic challenge repo")
+    parser.add_argument("root", help="directory to create the challenges in")
+    parser.add_argument("--count", "-n", type=int, default=100)
+    parser.add_argument("--files", type=int, default=1, help="files per challenge")
+    parser.add_argument(
+        "--file-size", type=int, default=4096, help="size of each file in bytes"
+    )
+    parser.add_argument(
+        "--json-ratio",
+        type=float,
+        default=0.2,
+        help="fraction of challenges using challenge.json",
+    )
+    parser.add_argument(
+        "--deploy-ratio",
+        type=float,
+        default=0.5,
+        help="fraction of challenges with a docker deployment",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    synthesize(
+        args.root,
+        args.count,
+        files=args.files,
+        file_size=args.file_size,
+        json_ratio=args.json_ratio,
+        deploy_ratio=args.deploy_ratio,
+        seed=args.seed,
+    )
+
+
+def synthesize(
+    root, count, files=1, file_size=4096, json_ratio=0.2, deploy_ratio=0.5, seed=0
+):
+    """
+    Create a repo of count challenges under root/challenges.
+
+    The output is deterministic for a given seed, so that runs can be
+    compared against each other.
+    """
+
+    rand = random.Random(seed)
+    paths = []
+    for i in range(count):
+        name = f"synthetic-{i}"
+        category = f"category-{i % 5}"
+        directory = os.path.join(root, "challenges", category, name)
+        os.makedirs(directory, exist_ok=True)
+
+        filenames = []
+        for j in range(files):
+            filename = f"file-{j}.bin"
+            with open(os.path.join(directory, filename), "wb") as f:
+                f.write(rand.getrandbits(file_size * 8).to_bytes(file_size, "little"))
+            filenames.append(filename)
+
+        data = {
+            "name": name,
+            "display": f"Synthetic {i}",
+            "category": category,
+            "description": f"Synthetic challenge number {i}.\n",
+            "points": rand.choice([50, 100, 200, 500]),
+            "flags": [f"FLAG{{synthetic_{i}}}", f"/FLAG\\{{synthetic_{i}_.*\\}}/"],
+            "hints": [
+                {"text": f"hint {j} for {i}", "cost": 10 * j}
+                for j in range(rand.randint(0, 3))
+            ],
+            "files": filenames,
+        }
+
+        # chain some challenges together, always onto earlier ones so that
+        # the requirements never form a cycle
+        if i > 0 and rand.random() < 0.2:
+            data["requirements"] = [f"synthetic-{rand.randrange(i)}"]
+
+        if rand.random() < deploy_ratio:
+            with open(os.path.join(directory, "Dockerfile"), "w") as f:
+                f.write("FROM alpine:latest\nCMD [\"sleep\", \"infinity\"]\n")
+            data["deploy"] = {
+                "docker": True,
+                "replicas": rand.choice([1, 1, 2, 3]),
+                "env": [f"SECRET_{i}"] if rand.random() < 0.3 else [],
+                "ports": [{"internal": 1337, "external": 30000 + i}],
+            }
+
+        if rand.random() < json_ratio:
+            path = os.path.join(directory, "challenge.json")
+            with open(path, "w") as f:
+                json.dump(data, f, indent=2)
+        else:
+            path = os.path.join(directory, "challenge.yaml")
+            with open(path, "w") as f:
+                yaml.dump(data, f)
+        paths.append(path)
+
+    return paths
+
+
+if __name__ == "__main__":
+    main()
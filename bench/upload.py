@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import common
+import ctftool
+import fakectfd
+import synth
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="benchmark uploading challenges to a fake CTFd"
+    )
+    parser.add_argument("--count", "-n", type=int, default=100)
+    parser.add_argument("--files", type=int, default=2, help="files per challenge")
+    parser.add_argument(
+        "--file-size", type=int, default=64 * 1024, help="size of each file in bytes"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="mean server latency in seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="fraction of requests to fail"
+    )
+    parser.add_argument(
+        "--no-sha1",
+        action="store_true",
+        help="don't report file hashes, like CTFd before 3.5",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        nargs="+",
+        default=[1, 8],
+        help="parallelism levels to benchmark",
+    )
+    common.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    for jobs in args.jobs:
+        for scenario, result in run(args, jobs).items():
+            results[f"{scenario} (jobs={jobs})"] = result
+
+    common.report(args, results, "scenario", COLUMNS, notes)
+
+
+def run(args, jobs):
+    """
+    Upload a fresh synthetic repo to a fresh server, then upload it again
+    unchanged, measuring both.
+    """
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        synth.synthesize(root, args.count, files=args.files, file_size=args.file_size)
+
+        server = fakectfd.FakeCTFd(
+            latency=args.latency, error_rate=args.error_rate, sha1=not args.no_sha1
+        )
+        server.start()
+        try:
+            os.chdir(root)
+            for scenario in ("initial", "unchanged"):
+                before = server.stats()
+                start = time.perf_counter()
+                success = upload(server.url, jobs)
+                elapsed = time.perf_counter() - start
+                after = server.stats()
+
+                results[scenario] = {
+                    "success": success,
+                    "wall_time": elapsed,
+                    "requests": after["requests"] - before["requests"],
+                    "writes": after["writes"] - before["writes"],
+                    "bytes": after["bytes_received"] - before["bytes_received"],
+                }
+        finally:
+            os.chdir(cwd)
+            server.stop()
+
+    return results
+
+
+def upload(url, jobs):
+    parser_args = [
+        "upload",
+        url,
+        "--token",
+        "benchmark",
+        "--jobs",
+        str(jobs),
+        "--format",
+        "ndjson",
+    ]
+    args = ctftool.build_parser().parse_args(parser_args)
+
+    # the results are measured on the server side, so discard the output
+    with contextlib.redirect_stdout(io.StringIO()):
+        with contextlib.redirect_stderr(io.StringIO()):
+            return args.func(args)
+
+
+COLUMNS = [
+    ("wall", 9, lambda result: f"{result['wall_time']:.2f}s"),
+    ("requests", 9, lambda result: str(result["requests"])),
+    ("writes", 7, lambda result: str(result["writes"])),
+    ("bytes", 10, lambda result: ctftool.format_bytes(result["bytes"])),
+]
+
+
+def notes(result, base):
+    if not result["success"]:
+        yield "(failed)"
+    if (wall := common.change(result, base, "wall_time")) is not None:
+        requests = result["requests"] - base["requests"]
+        yield f"{wall:+.0%} wall, {requests:+} requests"
+
+
+if __name__ == "__main__":
+    main()
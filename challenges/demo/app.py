@@ -1,8 +1,15 @@
+import os
+
 import flask
 from flask import Flask
 
 app = Flask(__name__)
 
+# read once at startup (before gunicorn forks its workers), rather than from
+# disk on every request
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "flag.txt")) as f:
+    FLAG = f.read()
+
 
 @app.route("/")
 def index():
@@ -11,9 +18,10 @@ def index():
 
 @app.route("/flag")
 def flag():
-    with open("flag.txt") as f:
-        return f.read()
+    return FLAG
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000)
+    # the development server, for running locally - the container uses
+    # gunicorn (see gunicorn.conf.py)
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8000)), threaded=True)
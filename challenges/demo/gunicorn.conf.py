@@ -0,0 +1,68 @@
+import math
+import os
+
+
+def cpu_count():
+    """
+    Count the CPUs this container can actually use, which (unlike
+    os.cpu_count) respects both its CPU affinity and any cgroup CPU quota.
+    """
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = cgroup_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+
+def cgroup_quota():
+    # cgroup v2, as "<quota> <period>" (or "max <period>" without a limit)
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1, where a quota of -1 means no limit
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota <= 0 or period <= 0:
+            return None
+        return quota / period
+    except (OSError, ValueError):
+        return None
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# the usual 2n + 1 processes, each with a few threads to cover for slow
+# clients - WEB_CONCURRENCY overrides the number of processes
+workers = int(os.environ.get("WEB_CONCURRENCY", 2 * cpu_count() + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# load the app (and its files) once, and share it between the workers
+preload_app = True
+
+# players' connections come and go quickly, so don't hold idle ones open
+keepalive = 2
+timeout = 30
+graceful_timeout = 10
+
+# recycle workers occasionally, in case a challenge leaks memory
+max_requests = 10000
+max_requests_jitter = 1000
+
+# keep per-request logging off the hot path
+accesslog = None
+errorlog = "-"
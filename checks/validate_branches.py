@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+import tempfile
+
+CTFTOOL = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "ctftool.py"
+)
+
+VALID = """\
+name: example
+display: Example
+category: misc
+description: An example.
+points: 10
+flags:
+  - FLAG{example}
+"""
+
+
+def main():
+    """
+    Check that cached validation results don't leak across branches: after
+    validating a broken challenge on a branch, switching back to a branch
+    where it's fine must validate cleanly, with or without the cache.
+    """
+
+    ok = True
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, "challenges", "example"))
+        path = os.path.join(root, "challenges", "example", "challenge.yaml")
+
+        with open(path, "w") as f:
+            f.write(VALID)
+        git(root, "init", "-q", "-b", "master")
+        git(root, "add", ".")
+        git(root, "commit", "-q", "-m", "valid")
+
+        git(root, "checkout", "-q", "-b", "broken")
+        with open(path, "w") as f:
+            f.write(VALID.replace("name: example", "name: Not Valid!"))
+        git(root, "commit", "-q", "-am", "broken")
+        for command in (["--incremental"], ["--since", "master"]):
+            if validate(root, command):
+                print(f"validate {' '.join(command)} passed on the broken branch")
+                ok = False
+
+        git(root, "checkout", "-q", "master")
+        # --since first, before anything else can refresh the cache
+        for command in (["--since", "master"], ["--incremental"], []):
+            if not validate(root, command):
+                print(f"validate {' '.join(command)} failed after switching back")
+                ok = False
+
+    if not ok:
+        sys.exit(1)
+    print("ok")
+
+
+def validate(root, args):
+    proc = subprocess.run(
+        [sys.executable, CTFTOOL, "validate", *args],
+        cwd=root,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return proc.returncode == 0
+
+
+def git(root, *args):
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "check",
+        "GIT_AUTHOR_EMAIL": "check@localhost",
+        "GIT_COMMITTER_NAME": "check",
+        "GIT_COMMITTER_EMAIL": "check@localhost",
+    }
+    subprocess.run(["git", *args], cwd=root, env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
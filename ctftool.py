@@ -1,39 +1,91 @@
 #!/usr/bin/env python3
 
+import abc
 import argparse
+import bisect
 import glob
 import json
+import math
 import os
 import sys
 import re
-import traceback
-import subprocess
-from typing import Any, Dict, Iterable, List, Optional
+import time
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 import colorama
-import requests
-import yaml
 from colorama import Fore, Style
 
 UPSTREAM = "https://raw.githubusercontent.com/jedevc/mini-ctf-tool/master/ctftool.py"
+CACHE_DIR = ".ctftool"
+
+# NOTE: heavy dependencies (requests, yaml, etc) are imported where they're
+# used, so that commands which don't need them (and scripts importing this
+# module) start quickly - see bench/startup.py.
 
 
 def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if hasattr(args, "func"):
+        return args.func(args)
+    else:
+        parser.print_help()
+
+    return True
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers()
 
-    list_parser = subparsers.add_parser("list", help="list all challenges")
+    format_parser = argparse.ArgumentParser(add_help=False)
+    format_parser.add_argument(
+        "--format",
+        choices=["text", "json", "ndjson"],
+        default="text",
+        help="output format",
+    )
+
+    list_parser = subparsers.add_parser(
+        "list", help="list all challenges", parents=[format_parser]
+    )
     list_parser.add_argument(
         "--verbose", "-v", action="store_true", help="increase verbosity"
     )
     list_parser.set_defaults(func=list_challenges)
 
     validate_parser = subparsers.add_parser(
-        "validate", help="validate all config files"
+        "validate", help="validate all config files", parents=[format_parser]
+    )
+    validate_parser.add_argument(
+        "--incremental",
+        "-i",
+        action="store_true",
+        help="only recheck challenges that have changed since the last run",
+    )
+    validate_parser.add_argument(
+        "--since",
+        metavar="REF",
+        help="like --incremental, but always recheck challenges that git says "
+        "have changed since REF",
     )
     validate_parser.set_defaults(func=validate_challenges)
 
     generate_parser = subparsers.add_parser("generate", help="generate challenge files")
+    generate_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=positive_int,
+        default=1,
+        help="number of challenges to generate files for in parallel",
+    )
+    generate_parser.add_argument(
+        "--force",
+        "-f",
+        action="store_true",
+        help="regenerate files, even if they're up to date",
+    )
     generate_parser.set_defaults(func=generate_files)
 
     clean_parser = subparsers.add_parser(
@@ -41,26 +93,180 @@ def main():
     )
     clean_parser.set_defaults(func=clean_files)
 
-    upload_parser = subparsers.add_parser("upload", help="upload all challenges")
+    watch_parser = subparsers.add_parser(
+        "watch", help="watch challenges, and revalidate them on change"
+    )
+    watch_parser.add_argument(
+        "--generate",
+        "-g",
+        action="store_true",
+        help="regenerate challenge files on change",
+    )
+    watch_parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="poll for changes, instead of using inotify",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.5,
+        help="seconds between polls",
+    )
+    watch_parser.set_defaults(func=watch_challenges)
+
+    upload_parser = subparsers.add_parser(
+        "upload", help="upload all challenges", parents=[format_parser]
+    )
     upload_parser.add_argument("url", help="base url of the CTFd instance")
     upload_parser.add_argument(
         "--token", "-t", required=True, help="token for the admin user"
     )
+    upload_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=positive_int,
+        default=1,
+        help="number of challenges to upload in parallel",
+    )
+    upload_parser.add_argument(
+        "--dry-run",
+        "-n",
+        action="store_true",
+        help="print the changes that would be made, without making them",
+    )
+    upload_parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="number of times to retry failed requests",
+    )
+    upload_parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="write a trace of all requests made (in chrome's trace event format)",
+    )
     upload_parser.set_defaults(func=upload_challenges)
 
+    # how to reach challenges, shared by the commands that connect to them
+    target_parser = argparse.ArgumentParser(add_help=False)
+    target_parser.add_argument(
+        "--host", default="localhost", help="host the challenges are deployed on"
+    )
+    target_parser.add_argument(
+        "--internal",
+        action="store_true",
+        help="use the internal ports, as when running a single container locally",
+    )
+    target_parser.add_argument(
+        "--http",
+        action="store_true",
+        help="use HTTP for every port (by default, only ports with a path in "
+        "their readiness or liveness probe are)",
+    )
+    target_parser.add_argument(
+        "--timeout", type=float, default=5, help="seconds before a connection fails"
+    )
+    target_parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=1,
+        help="seconds to wait for a greeting from non-HTTP ports",
+    )
+
+    probe_parser = subparsers.add_parser(
+        "probe",
+        help="check that deployed challenges respond, and how quickly",
+        parents=[target_parser],
+    )
+    probe_parser.add_argument(
+        "challenges", nargs="*", help="challenges to probe (defaults to all of them)"
+    )
+    probe_parser.add_argument(
+        "--count", "-c", type=positive_int, default=5, help="number of probes per port"
+    )
+    probe_parser.add_argument(
+        "--interval", type=float, default=0.5, help="seconds between probes"
+    )
+    probe_parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=64,
+        help="maximum number of probes in flight",
+    )
+    probe_parser.add_argument(
+        "--format",
+        choices=["text", "json", "ndjson", "prometheus"],
+        default="text",
+        help="output format",
+    )
+    probe_parser.set_defaults(func=probe_challenges)
+
+    loadtest_parser = subparsers.add_parser(
+        "loadtest",
+        help="ramp up connections against challenges, to size their replicas",
+        parents=[format_parser, target_parser],
+    )
+    loadtest_parser.add_argument("challenges", nargs="+", help="challenges to test")
+    loadtest_parser.add_argument(
+        "--start",
+        type=positive_int,
+        default=1,
+        help="concurrent connections to start with",
+    )
+    loadtest_parser.add_argument(
+        "--max",
+        type=positive_int,
+        default=256,
+        help="concurrent connections to stop at (doubling from --start)",
+    )
+    loadtest_parser.add_argument(
+        "--duration", type=float, default=10, help="seconds to hold each step for"
+    )
+    loadtest_parser.add_argument(
+        "--target-latency",
+        type=float,
+        default=250,
+        help="p99 latency (in milliseconds) a replica should stay under",
+    )
+    loadtest_parser.add_argument(
+        "--max-error-rate",
+        type=float,
+        default=0.01,
+        help="fraction of failed connections a replica should stay under",
+    )
+    loadtest_parser.add_argument(
+        "--peak",
+        type=positive_int,
+        default=100,
+        help="concurrent connections expected at peak, to recommend replicas for",
+    )
+    loadtest_parser.set_defaults(func=loadtest_challenges)
+
     upgrade_parser = subparsers.add_parser("upgrade", help="upgrade ctftool")
     upgrade_parser.set_defaults(func=upgrade)
 
-    args = parser.parse_args()
-    if hasattr(args, "func"):
-        return args.func(args)
-    else:
-        parser.print_help()
+    return parser
 
-    return True
+
+def positive_int(value: str) -> int:
+    # an argparse type, so that bad values get a usage error
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
 
 
 def list_challenges(args):
+    if args.format != "text":
+        with Reporter(args.format) as reporter:
+            for challenge in Challenge.load_all(True):
+                reporter.emit(challenge_record(challenge))
+        return True
+
     cache = {}
     for challenge in Challenge.load_all(True):
         if challenge.category not in cache:
@@ -81,8 +287,8 @@ def list_challenges(args):
 
                 print(f"\tdescription: {description}")
                 print(f"\tpoints: {challenge.points}")
-                print(f"\tflags: {challenge.flags}")
-                print(f"\tfiles: {challenge.files}")
+                print(f"\tflags: {list(challenge.flags)}")
+                print(f"\tfiles: {list(challenge.files)}")
 
     return True
 
@@ -93,351 +299,2252 @@ def validate_challenges(args):
     existing_names = set()
     existing_displays = set()
 
-    for challenge in Challenge.load_all(False):
-        print(challenge.path, end="")
+    reporter = Reporter(args.format)
+    text = args.format == "text"
 
-        failed = False
+    cache = None
+    changed = None
+    if args.incremental or args.since:
+        cache = ValidateCache()
+    if args.since:
+        changed = git_changed_directories(args.since)
 
-        def fail(message):
-            nonlocal failed, success
-            failed = True
-            success = False
-            print(f"\n{Fore.RED}✗{Style.RESET_ALL} {message}", end="")
+    for challenge in Challenge.load_all(False):
+        if text:
+            print(challenge.path, end="")
 
-        NAME_REGEX = "^[a-z0-9-_]+$"
+        start = time.perf_counter()
 
         if challenge.error is not None:
-            fail(f"challenge parse error ({challenge.error})")
+            errors = [f"challenge parse error ({challenge.error})"]
+        elif cache is None:
+            errors = check_challenge(challenge)
         else:
-            if not challenge.name:
-                fail("challenge 'name' must not be empty")
-            elif not re.match(NAME_REGEX, challenge.name):
-                fail(f"challenge 'name' does not match regex \"{NAME_REGEX}\"")
-            elif challenge.name in existing_names:
-                fail("challenge 'name' must not be a duplicate")
+            # the cache doesn't know which tree its results came from, so
+            # they're only trusted while the files are untouched (switching
+            # branches rewrites them) - and with --since, never for those
+            # git says have changed
+            errors = None
+            fingerprint = ValidateCache.fingerprint(challenge)
+            directory = os.path.normpath(os.path.dirname(challenge.path))
+            if changed is None or directory not in changed:
+                errors = cache.get(challenge.path, fingerprint)
+            if errors is None:
+                errors = check_challenge(challenge)
+                cache.set(challenge.path, fingerprint, errors)
             else:
-                existing_names.add(challenge.name)
+                cache.keep(challenge.path)
+
+            # don't let the cached errors get modified
+            errors = list(errors)
+
+        # uniqueness depends on every challenge, so is never cached
+        if challenge.error is None:
+            if challenge.name and re.match(NAME_REGEX, challenge.name):
+                if challenge.name in existing_names:
+                    errors.append("challenge 'name' must not be a duplicate")
+                else:
+                    existing_names.add(challenge.name)
+
+            if challenge.display:
+                if challenge.display in existing_displays:
+                    errors.append("challenge 'display' must not be a duplicate")
+                else:
+                    existing_displays.add(challenge.display)
+
+        if errors:
+            success = False
 
-            if not challenge.display:
-                fail("challenge 'display' must not be empty")
-            elif challenge.display in existing_displays:
-                fail("challenge 'display' must not be a duplicate")
-            else:
-                existing_displays.add(challenge.display)
+        if not text:
+            reporter.emit(
+                {
+                    **challenge_record(challenge, brief=True),
+                    "valid": not errors,
+                    "errors": errors,
+                    "validate_time": time.perf_counter() - start,
+                }
+            )
+        elif errors:
+            for message in errors:
+                print(f"\n{Fore.RED}✗{Style.RESET_ALL} {message}", end="")
+            print()
+        else:
+            print(f" {Fore.GREEN}✔{Style.RESET_ALL}")
 
-            if not challenge.category:
-                fail("challenge 'category' must not be empty")
+    if cache is not None:
+        cache.save()
 
-            for filename in challenge.files:
-                if filename in challenge.generate:
-                    # generated files may not exist at time of validation
-                    continue
+    reporter.close()
+    return success
 
-                filename_relative = os.path.join(
-                    os.path.dirname(challenge.path), filename
-                )
-                if not os.path.exists(filename_relative):
-                    fail(f'challenge file "{filename}" does not exist')
-
-            for hint in challenge.hints:
-                if not isinstance(hint, dict):
-                    fail("challenge hint is not a map")
-                elif "text" not in hint:
-                    fail("challenge hint does not have text")
-                elif "cost" not in hint:
-                    fail("challenge hint does not have a cost")
-
-            if len(challenge.flags) == 0:
-                fail("challenge must have at least 1 flag")
-            for flag in challenge.flags:
-                starts = flag.startswith("/")
-                ends = flag.endswith("/")
-                if starts and not ends:
-                    fail(
-                        "challenge flag invalid regex: starts with '/' but does not end with '/'"
-                    )
-                if not starts and ends:
-                    fail(
-                        "challenge flag invalid regex: ends with '/' but does not start with '/'"
-                    )
 
-            if challenge.state not in ("visible", "hidden"):
-                fail("challenge state must be either 'visible' or 'hidden'")
+NAME_REGEX = "^[a-z0-9-_]+$"
 
-        if failed:
-            print()
-        else:
-            print(f" {Fore.GREEN}✔{Style.RESET_ALL}")
 
-    return success
+def check_challenge(challenge: "Challenge") -> List[str]:
+    """
+    Check a single challenge, returning a list of problems with it.
 
+    This only covers the checks that depend on the challenge alone - checks
+    across all challenges are left to the caller.
+    """
 
-def generate_files(args):
-    success = True
+    errors = []
+    fail = errors.append
 
-    for challenge in Challenge.load_all(False):
-        for filename, command in challenge.generate.items():
-            cwd = os.path.dirname(challenge.path)
+    if not challenge.name:
+        fail("challenge 'name' must not be empty")
+    elif not re.match(NAME_REGEX, challenge.name):
+        fail(f"challenge 'name' does not match regex \"{NAME_REGEX}\"")
 
-            try:
-                subprocess.run(command, shell=True, check=True, cwd=cwd)
-            except subprocess.CalledProcessError:
-                print(f"failed to generate {filename} {Fore.RED}✗{Style.RESET_ALL}")
-                success = False
-                raise
+    if not challenge.display:
+        fail("challenge 'display' must not be empty")
 
-            if not os.path.exists(os.path.join(cwd, filename)):
-                print(f"did not generate {filename} {Fore.RED}✗{Style.RESET_ALL}")
-                success = False
-            else:
-                print(f"generated {filename} {Fore.GREEN}✔{Style.RESET_ALL}")
+    if not challenge.category:
+        fail("challenge 'category' must not be empty")
 
-    return success
+    for filename in challenge.files:
+        if filename in challenge.generate:
+            # generated files may not exist at time of validation
+            continue
 
+        filename_relative = os.path.join(os.path.dirname(challenge.path), filename)
+        if not os.path.exists(filename_relative):
+            fail(f'challenge file "{filename}" does not exist')
+
+    for hint in challenge.hints:
+        if not isinstance(hint, dict):
+            fail("challenge hint is not a map")
+        elif "text" not in hint:
+            fail("challenge hint does not have text")
+        elif "cost" not in hint:
+            fail("challenge hint does not have a cost")
+
+    if len(challenge.flags) == 0:
+        fail("challenge must have at least 1 flag")
+    for flag in challenge.flags:
+        starts = flag.startswith("/")
+        ends = flag.endswith("/")
+        if starts and not ends:
+            fail(
+                "challenge flag invalid regex: starts with '/' but does not end with '/'"
+            )
+        if not starts and ends:
+            fail(
+                "challenge flag invalid regex: ends with '/' but does not start with '/'"
+            )
 
-def clean_files(args):
-    for challenge in Challenge.load_all(False):
-        for filename in challenge.generate.keys():
-            cwd = os.path.dirname(challenge.path)
-            try:
-                os.remove(os.path.join(cwd, filename))
-            except FileNotFoundError:
-                pass
+    if challenge.state not in ("visible", "hidden"):
+        fail("challenge state must be either 'visible' or 'hidden'")
 
+    if challenge.deploy is not None:
+        errors.extend(check_deploy(challenge.deploy))
 
-def upload_challenges(args):
-    ctfd = CTFd(args.url, args.token)
-    success = True
+    return errors
 
-    challenges = {}
-    online = {data["name"]: data for data in ctfd.list()}
 
-    # upload challenges
-    for challenge in Challenge.load_all():
-        print(challenge.path, end="")
-        try:
-            if challenge.display in online:
-                challenge_id = ctfd.reupload(online[challenge.display]["id"], challenge)
-                print(f"{Fore.YELLOW} ~")
-            else:
-                challenge_id = ctfd.upload(challenge)
-                print(f"{Fore.GREEN} ✓")
+def check_deploy(deploy: "Deploy") -> List[str]:
+    errors = []
+    fail = errors.append
 
-            setattr(challenge, "id", challenge_id)
-            challenges[challenge.name] = challenge
-        except Exception as e:
-            success = False
-            print(f"{Fore.RED} ✗ {e}")
-            continue
+    if not isinstance(deploy.replicas, int) or deploy.replicas < 0:
+        fail("challenge deploy 'replicas' must be a non-negative integer")
 
-    # apply requirements
-    for name, challenge in challenges.items():
-        ctfd.requirements(challenge, challenges)
+    resources = deploy.resources
+    if resources is not None:
+        quantities = {}
+        for kind in ("requests", "limits"):
+            values = getattr(resources, kind)
+            if not isinstance(values, dict):
+                fail(f"challenge deploy resource {kind} is not a map")
+                continue
 
-    return success
+            for key, value in values.items():
+                if key not in ("cpu", "memory"):
+                    fail(f"challenge deploy resource {kind} has unknown key '{key}'")
+                elif (quantity := parse_quantity(value)) is None:
+                    fail(f"challenge deploy resource {kind} {key} is not a quantity")
+                else:
+                    quantities[kind, key] = quantity
+
+        for key in ("cpu", "memory"):
+            request = quantities.get(("requests", key))
+            limit = quantities.get(("limits", key))
+            if request is not None and limit is not None and request > limit:
+                fail(f"challenge deploy resource request for {key} exceeds its limit")
+
+    internal = {port.internal for port in deploy.ports}
+    for name in ("readiness", "liveness"):
+        probe = getattr(deploy, name)
+        if probe is None:
+            continue
 
+        if probe.port not in internal:
+            fail(f"challenge deploy {name} port must be one of the internal ports")
+        if probe.path is not None and not str(probe.path).startswith("/"):
+            fail(f"challenge deploy {name} path must start with '/'")
+        if not isinstance(probe.delay, int) or probe.delay < 0:
+            fail(f"challenge deploy {name} delay must be a non-negative integer")
+        if not isinstance(probe.period, int) or probe.period < 1:
+            fail(f"challenge deploy {name} period must be a positive integer")
+
+    autoscale = deploy.autoscale
+    if autoscale is not None:
+        if not isinstance(autoscale.min, int) or autoscale.min < 1:
+            fail("challenge deploy autoscale 'min' must be at least 1")
+        elif not isinstance(autoscale.max, int) or autoscale.max < autoscale.min:
+            fail("challenge deploy autoscale 'max' must be at least 'min'")
+        if not isinstance(autoscale.target, int) or not 0 < autoscale.target <= 100:
+            fail("challenge deploy autoscale 'target' must be a percentage")
+
+        # utilization is measured relative to the request
+        requests = resources.requests if resources is not None else {}
+        if not isinstance(requests, dict) or "cpu" not in requests:
+            fail("challenge deploy autoscale needs a cpu request in 'resources'")
+
+    return errors
+
+
+# multipliers for the suffixes of kubernetes resource quantities
+QUANTITY_SUFFIXES = {
+    "": 1,
+    "m": 1e-3,
+    "k": 1e3,
+    "M": 1e6,
+    "G": 1e9,
+    "T": 1e12,
+    "Ki": 2 ** 10,
+    "Mi": 2 ** 20,
+    "Gi": 2 ** 30,
+    "Ti": 2 ** 40,
+}
+
+
+def parse_quantity(value: Any) -> Optional[float]:
+    """
+    Parse a kubernetes resource quantity (like 0.5, 250m or 128Mi), returning
+    None if it isn't one.
+    """
 
-def upgrade(args):
-    # download new code
-    source_code = requests.get(UPSTREAM).text
+    if isinstance(value, bool):
+        return None
+    elif isinstance(value, (int, float)):
+        return float(value) if value >= 0 else None
+    elif not isinstance(value, str):
+        return None
 
-    # write code
-    path = os.path.realpath(__file__)
-    with open(path, "w") as ctftool:
-        ctftool.write(source_code)
+    match = re.fullmatch(r"([0-9]+(?:\.[0-9]*)?|\.[0-9]+)([A-Za-z]*)", value)
+    if match is None or match.group(2) not in QUANTITY_SUFFIXES:
+        return None
+    return float(match.group(1)) * QUANTITY_SUFFIXES[match.group(2)]
 
 
-class Challenge:
+def git_changed_directories(ref: str) -> Optional[set]:
     """
-    Interface to the challenge files and their contained data.
+    Find every directory containing a file that differs from the given ref,
+    including untracked files. Returns None if git can't tell us.
     """
 
-    def __init__(
-        self,
-        name: str,
-        display: str,
-        category: str,
-        path: Optional[str] = None,
-        description: str = "",
-        points: int = 0,
-        flags: List[str] = None,
-        files: List[str] = None,
-        hints: List[Dict[str, Any]] = None,
-        generate: Dict[str, str] = None,
-        requirements: List[str] = None,
-        deploy: "Deploy" = None,
-        state: str = "visible",
-    ):
-        self.name = name
-        self.display = display
-        self.category = category
-        self.path = path
-        self.description = description
-        self.points = points
-        self.flags = flags or []
-        self.files = files or []
-        self.hints = hints or []
-        self.generate = generate or {}
-        self.requirements = requirements or []
-        self.deploy = deploy
-        self.state = state
+    import subprocess
 
-        self.error: Optional[Exception] = None
+    commands = [
+        ["git", "diff", "--name-only", "--relative", ref, "--"],
+        ["git", "ls-files", "--others", "--exclude-standard"],
+    ]
 
-    @property
-    def githash(self) -> Optional[str]:
+    directories = set()
+    for command in commands:
         proc = subprocess.run(
-            ["git", "log", "-n", "1", "--pretty=format:%h", "--", os.path.dirname(self.path)],
-            stdout=subprocess.PIPE,
+            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
         )
-        out = proc.stdout.decode().strip()
-        if out:
-            return out
-        else:
+        if proc.returncode != 0:
             return None
 
-    @staticmethod
-    def load_all(suppress_errors: bool = False) -> Iterable["Challenge"]:
-        globpath = "challenges/**/challenge.*"
-        paths = glob.glob(globpath, recursive=True)
+        for line in proc.stdout.splitlines():
+            directory = os.path.dirname(os.path.normpath(line))
+            while directory and directory not in directories:
+                directories.add(directory)
+                directory = os.path.dirname(directory)
 
-        for path in paths:
-            yield Challenge.load(path, suppress_errors)
+    return directories
 
-    @staticmethod
-    def load(filename: str, suppress_errors: bool = False) -> "Challenge":
-        try:
-            return Challenge._load(filename)
-        except Exception as e:
-            if suppress_errors:
-                challenge = Challenge("", "", filename)
-                challenge.error = e
-                return challenge
-            else:
-                raise
 
-    @staticmethod
-    def _load(filename: str) -> "Challenge":
-        with open(filename) as f:
-            ext = os.path.splitext(filename)[-1]
-            if ext == ".yaml" or ext == ".yml":
-                data = yaml.safe_load(f)
-            elif ext == ".json":
-                data = json.load(f)
-            else:
-                raise ChallengeLoadError(f'unknown file extension "{ext}"')
+def generate_files(args):
+    cache = GenerateCache()
 
-        chal = Challenge._load_dict(data)
-        chal.path = filename
-        return chal
+    def generate(challenge):
+        # when running in parallel, keep the output of each command
+        # together, rather than interleaving them
+        return generate_challenge(
+            challenge, cache, force=args.force, capture=args.jobs > 1
+        )
 
-    @staticmethod
-    def _load_dict(data: Dict[str, Any]) -> "Challenge":
-        return Challenge(
-            name=data.get("name", ""),
-            display=data.get("display", ""),
-            category=data.get("category", ""),
-            path=None,
-            description=data.get("description", ""),
-            points=data.get("points", 0),
-            flags=data.get("flags", []),
-            files=data.get("files", []),
-            hints=data.get("hints", []),
-            generate=data.get("generate", {}),
-            requirements=data.get("requirements", []),
-            deploy=Deploy._load_dict(data.get("deploy", {})),
-            state=data.get("state", "visible"),
+    import concurrent.futures
+
+    failures = []
+    challenges = [
+        challenge for challenge in Challenge.load_all(False) if challenge.generate
+    ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        for results in executor.map(generate, challenges):
+            for filename, status, output in results:
+                if status == "failed":
+                    if output:
+                        print(output, end="")
+                    print(
+                        f"failed to generate {filename} {Fore.RED}✗{Style.RESET_ALL}"
+                    )
+                    failures.append(filename)
+                elif status == "missing":
+                    if output:
+                        print(output, end="")
+                    print(f"did not generate {filename} {Fore.RED}✗{Style.RESET_ALL}")
+                    failures.append(filename)
+                elif status == "up to date":
+                    print(f"{filename} is up to date {Fore.GREEN}✔{Style.RESET_ALL}")
+                else:
+                    print(f"generated {filename} {Fore.GREEN}✔{Style.RESET_ALL}")
+
+    cache.save()
+
+    if failures:
+        print(
+            f"{Fore.RED}failed to generate {len(failures)} file(s): "
+            + ", ".join(failures)
         )
+        return False
+    return True
 
 
-class Deploy:
-    def __init__(
-        self,
-        docker: bool = False,
-        replicas: int = 1,
-        env: List[str] = None,
-        ports: List["Port"] = None,
-    ):
-        self.docker = docker
-        self.replicas = replicas
-        self.env = env if env else []
-        self.ports = ports if ports else []
+def generate_challenge(
+    challenge: "Challenge",
+    cache: "GenerateCache",
+    force: bool = False,
+    capture: bool = False,
+) -> List[Tuple[str, str, Optional[str]]]:
+    """
+    Generate the files for a challenge, skipping those that are up to date.
 
-    @staticmethod
-    def _load_dict(data: Dict[str, Any]) -> "Deploy":
-        return Deploy(
-            docker=data.get("docker", False),
-            replicas=data.get("replicas", 1),
-            env=data.get("env", []),
-            ports=[Port._load_dict(port) for port in data.get("ports", [])],
-        )
+    Returns the status of each file, along with the output of its command if
+    it was captured.
+    """
 
+    import subprocess
 
-class Port:
-    def __init__(self, internal: int, external: int, protocol: str = "tcp"):
-        self.internal = internal
-        self.external = external
-        self.protocol = protocol
+    cwd = os.path.dirname(challenge.path)
+    outputs = set(challenge.generate)
+    dirhash = hash_directory(cwd, exclude=outputs)
 
-    @staticmethod
-    def _load_dict(data: Dict[str, Any]) -> "Port":
-        return Port(
-            internal=data.get("internal", 0),
-            external=data.get("external", 0),
-            protocol=data.get("protocol", "tcp"),
+    results = []
+    for filename, command in challenge.generate.items():
+        path = os.path.join(cwd, filename)
+        key = cache.key(command, dirhash)
+        if not force and os.path.exists(path) and cache.get(path) == key:
+            results.append((filename, "up to date", None))
+            continue
+
+        proc = subprocess.run(
+            command,
+            shell=True,
+            cwd=cwd,
+            stdout=subprocess.PIPE if capture else None,
+            stderr=subprocess.STDOUT if capture else None,
+            text=True,
         )
+        if proc.returncode != 0:
+            results.append((filename, "failed", proc.stdout))
+        elif not os.path.exists(path):
+            results.append((filename, "missing", proc.stdout))
+        else:
+            results.append((filename, "generated", None))
 
-    def __repr__(self) -> str:
-        return f"<Port {self.external}:{self.internal}/{self.protocol}>"
+    # remember what the outputs were generated from, now that any
+    # intermediate files have been created too
+    if all(status in ("up to date", "generated") for _, status, _ in results):
+        dirhash = hash_directory(cwd, exclude=outputs)
+        for filename, command in challenge.generate.items():
+            cache.set(os.path.join(cwd, filename), cache.key(command, dirhash))
 
-    def __str__(self) -> str:
-        return repr(self)
+    return results
 
 
-class ChallengeLoadError(RuntimeError):
-    pass
+def clean_files(args):
+    for challenge in Challenge.load_all(False):
+        for filename in challenge.generate.keys():
+            cwd = os.path.dirname(challenge.path)
+            try:
+                os.remove(os.path.join(cwd, filename))
+            except FileNotFoundError:
+                pass
 
 
-class CTFd:
-    """
-    Client for CTFd server.
+def watch_challenges(args):
+    root = "challenges"
+    cache = GenerateCache()
 
-    This has been tested with CTFd 3.0.0 on API v1 and should continue
-    to work in the future, as long as the API doesn't change too much.
-    """
+    index: Dict[str, Challenge] = {}
+    for challenge in Challenge.load_all(True):
+        index[os.path.normpath(challenge.path)] = challenge
 
-    def __init__(self, url: str, token: str):
-        self.base = url
-        self.session = requests.Session()
+    def report(path: str, elapsed: float):
+        challenge = index.get(path)
+        if challenge is None:
+            print(f"{path} {Fore.LIGHTBLACK_EX}removed{Style.RESET_ALL}")
+            return
 
-        self.session.headers.update({"Authorization": f"Token {token}"})
+        if challenge.error is not None:
+            errors = [f"challenge parse error ({challenge.error})"]
+        else:
+            errors = check_challenge(challenge)
+            for other in index.values():
+                if other is challenge or other.error is not None:
+                    continue
+                if challenge.name and other.name == challenge.name:
+                    errors.append(f"challenge 'name' is a duplicate of {other.path}")
+                if challenge.display and other.display == challenge.display:
+                    errors.append(
+                        f"challenge 'display' is a duplicate of {other.path}"
+                    )
 
-    def list(self) -> List[Any]:
-        resp = self.session.get(f"{self.base}/api/v1/challenges?view=admin", json={})
-        resp.raise_for_status()
-        return resp.json()["data"]
+        timing = f"{Fore.LIGHTBLACK_EX}({elapsed * 1000:.0f}ms){Style.RESET_ALL}"
+        if errors:
+            print(f"{path} {timing}", end="")
+            for message in errors:
+                print(f"\n{Fore.RED}✗{Style.RESET_ALL} {message}", end="")
+            print()
+        else:
+            print(f"{path} {Fore.GREEN}✔{Style.RESET_ALL} {timing}")
+
+    failed = 0
+    for path in sorted(index):
+        start = time.perf_counter()
+        challenge = index[path]
+        if challenge.error is not None or check_challenge(challenge):
+            failed += 1
+            report(path, time.perf_counter() - start)
+    print(f"watching {len(index)} challenges ({failed} with problems)...")
+
+    watcher = Watcher.create(root, poll=args.poll, interval=args.interval)
+    try:
+        while True:
+            changed = watcher.wait()
+            if not changed:
+                continue
+            start = time.perf_counter()
+
+            # work out which challenges are affected by the changes
+            affected = set()
+            regenerate = set()
+            for path in changed:
+                if re.match(r"challenge\.[^.]+$", os.path.basename(path)):
+                    if os.path.exists(path):
+                        index[path] = Challenge.load(path, suppress_errors=True)
+                    else:
+                        index.pop(path, None)
+                    affected.add(path)
+                    regenerate.add(path)
+                    continue
 
-    def upload(self, challenge: Challenge) -> int:
-        # create challenge
-        data = {
-            "name": challenge.display,
-            "category": challenge.category,
-            "state": challenge.state,
-            "value": challenge.points,
-            "type": "standard",
-            "description": challenge.description,
-        }
-        resp = self.session.post(f"{self.base}/api/v1/challenges", json=data)
-        resp.raise_for_status()
-        resp_data = resp.json()
-        challenge_id = int(resp_data["data"]["id"])
+                for chal_path, challenge in index.items():
+                    directory = os.path.dirname(chal_path)
+                    if not path.startswith(directory + os.sep):
+                        continue
+
+                    affected.add(chal_path)
+                    relative = os.path.relpath(path, directory)
+                    if relative not in challenge.generate:
+                        regenerate.add(chal_path)
+
+            if args.generate:
+                for path in sorted(regenerate):
+                    challenge = index.get(path)
+                    if challenge is None or challenge.error is not None:
+                        continue
+                    for filename, status, output in generate_challenge(
+                        challenge, cache, capture=True
+                    ):
+                        if status in ("failed", "missing"):
+                            if output:
+                                print(output, end="")
+                            print(
+                                f"failed to generate {filename} "
+                                f"{Fore.RED}✗{Style.RESET_ALL}"
+                            )
+                        elif status == "generated":
+                            print(
+                                f"generated {filename} "
+                                f"{Fore.GREEN}✔{Style.RESET_ALL}"
+                            )
+                cache.save()
+
+            for path in sorted(affected):
+                report(path, time.perf_counter() - start)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
 
-        self._upload_parts(challenge_id, challenge)
+    return True
 
-        return challenge_id
 
-    def requirements(
-        self,
+def _upload_challenges(args, ctfd: "CTFd"):
+    import concurrent.futures
+
+    success = True
+
+    challenges = {}
+    online = {data["name"]: data for data in ctfd.list()}
+
+    reporter = Reporter(args.format)
+    text = args.format == "text"
+
+    def upload(challenge):
+        start = time.perf_counter()
+        ctfd.reset_bytes_sent()
+
+        if challenge.display in online:
+            challenge_id = online[challenge.display]["id"]
+            changes = ctfd.plan(challenge_id, challenge)
+            if not args.dry_run:
+                ctfd.apply(challenge_id, changes)
+            created = False
+        elif args.dry_run:
+            challenge_id = None
+            changes = ctfd.plan(None, challenge)
+            created = True
+        else:
+            challenge_id = ctfd.upload(challenge)
+            changes = []
+            created = True
+
+        stats = {
+            "upload_time": time.perf_counter() - start,
+            "bytes_sent": ctfd.bytes_sent(),
+        }
+        return challenge_id, changes, created, stats
+
+    def fail(challenge, error):
+        if text:
+            print(f"{challenge.path}{Fore.RED} ✗ {error}")
+        else:
+            reporter.emit(
+                {
+                    **challenge_record(challenge, brief=True),
+                    "action": "failed",
+                    "error": str(error),
+                }
+            )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        # upload challenges
+        futures = {
+            executor.submit(upload, challenge): challenge
+            for challenge in Challenge.load_all()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            challenge = futures[future]
+            try:
+                challenge_id, changes, created, stats = future.result()
+            except Exception as e:
+                success = False
+                fail(challenge, e)
+                continue
+
+            if not text:
+                reporter.emit(
+                    {
+                        **challenge_record(challenge, brief=True),
+                        "action": "created" if created else "updated",
+                        "id": challenge_id,
+                        "changes": [str(change) for change in changes],
+                        **stats,
+                    }
+                )
+            elif created:
+                print(f"{challenge.path}{Fore.GREEN} ✓")
+            else:
+                print(f"{challenge.path}{Fore.YELLOW} ~")
+            if text and args.dry_run:
+                for change in changes:
+                    print(f"\t{change}")
+
+            challenge.id = challenge_id
+            challenges[challenge.name] = challenge
+
+        if args.dry_run:
+            reporter.close()
+            return success
+        ctfd.manifest.save()
+
+        # apply requirements, now that all the challenge ids are known
+        futures = {}
+        for challenge in challenges.values():
+            missing = [req for req in challenge.requirements if req not in challenges]
+            if missing:
+                # linking only some of them would unlock the challenge early
+                success = False
+                fail(challenge, f"prerequisites not uploaded: {', '.join(missing)}")
+                continue
+            future = executor.submit(ctfd.requirements, challenge, challenges)
+            futures[future] = challenge
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                success = False
+                fail(futures[future], f"requirements: {e}")
+
+    reporter.close()
+    return success
+
+
+def upload_challenges(args):
+    manifest = FileManifest(args.url)
+    ctfd = CTFd(
+        args.url,
+        args.token,
+        connections=args.jobs,
+        manifest=manifest,
+        retries=args.retries,
+    )
+
+    try:
+        return _upload_challenges(args, ctfd)
+    finally:
+        # keep stdout clean for machine readable formats
+        out = sys.stdout if args.format == "text" else sys.stderr
+        print(ctfd.metrics.summary(), file=out)
+        if args.trace:
+            ctfd.metrics.write_trace(args.trace)
+
+
+def probe_challenges(args):
+    import asyncio
+
+    challenges = [
+        challenge
+        for challenge in Challenge.load_all(True)
+        if challenge.error is None
+        and (not args.challenges or challenge.name in args.challenges)
+    ]
+    targets = probe_targets(challenges, args.host, args.internal, args.http)
+    if not targets:
+        print(f"{Fore.YELLOW}no challenge ports to probe", file=sys.stderr)
+        return True
+
+    results = asyncio.run(
+        run_probes(
+            targets,
+            count=args.count,
+            interval=args.interval,
+            timeout=args.timeout,
+            read_timeout=args.read_timeout,
+            concurrency=args.concurrency,
+        )
+    )
+    records = [probe_record(target, results[i]) for i, target in enumerate(targets)]
+
+    if args.format == "prometheus":
+        print(format_prometheus(records), end="")
+    elif args.format != "text":
+        with Reporter(args.format) as reporter:
+            for record in records:
+                reporter.emit(record)
+    else:
+        header = ("target", "ok", "connect p50", "p99", "first byte p50", "p99")
+        rows = [
+            (
+                f"{record['challenge']} ({record['protocol']} {record['port']})",
+                f"{record['successes']}/{record['probes']}",
+                format_latency(record["connect_p50"]),
+                format_latency(record["connect_p99"]),
+                format_latency(record["first_byte_p50"]),
+                format_latency(record["first_byte_p99"]),
+            )
+            for record in records
+        ]
+        lines = format_table(header, rows)
+        print(f"  {lines[0]}")
+        for record, line in zip(records, lines[1:]):
+            if record["successes"] == record["probes"]:
+                print(f"{Fore.GREEN}✓{Style.RESET_ALL} {line}")
+            elif record["successes"]:
+                print(f"{Fore.YELLOW}~{Style.RESET_ALL} {line}  {record['error']}")
+            else:
+                print(f"{Fore.RED}✗{Style.RESET_ALL} {line}  {record['error']}")
+
+    return all(record["successes"] > 0 for record in records)
+
+
+def loadtest_challenges(args):
+    import asyncio
+
+    challenges = {
+        challenge.name: challenge
+        for challenge in Challenge.load_all(True)
+        if challenge.error is None
+    }
+    missing = [name for name in args.challenges if name not in challenges]
+    if missing:
+        print(f"{Fore.RED}unknown challenges: {', '.join(missing)}", file=sys.stderr)
+        return False
+
+    selected = [challenges[name] for name in args.challenges]
+    targets = probe_targets(selected, args.host, args.internal, args.http)
+    if not targets:
+        print(f"{Fore.YELLOW}no challenge ports to test", file=sys.stderr)
+        return True
+
+    target_latency = args.target_latency / 1000
+    success = True
+    reporter = Reporter(args.format) if args.format != "text" else None
+    for target in targets:
+        if reporter is None:
+            print(
+                f"{Style.BRIGHT}{target.challenge} "
+                f"({target.protocol} {target.host}:{target.port}){Style.RESET_ALL}"
+            )
+
+        # one step at a time, since each one has the challenge to itself
+        stages = []
+        concurrency = max(args.start, 1)
+        while concurrency <= args.max:
+            stage = asyncio.run(
+                run_load(
+                    target,
+                    concurrency,
+                    duration=args.duration,
+                    timeout=args.timeout,
+                    read_timeout=args.read_timeout,
+                )
+            )
+            stages.append(stage)
+            if reporter is None:
+                print_load_stage(stage, target_latency)
+            if not stage_healthy(stage, target_latency, args.max_error_rate):
+                # past the knee, so more connections would only pile up
+                break
+            concurrency *= 2
+
+        record = load_record(
+            target,
+            stages,
+            deploy=challenges[target.challenge].deploy,
+            peak=args.peak,
+            target_latency=target_latency,
+            max_error_rate=args.max_error_rate,
+        )
+        capacity = record["capacity"]
+        if capacity is None:
+            success = False
+        if reporter is not None:
+            reporter.emit(record)
+        elif capacity is None:
+            print(
+                f"{Fore.RED}✗ not even {stages[0]['concurrency']} connections met "
+                f"the target of {args.target_latency:g}ms p99"
+            )
+        else:
+            enough = capacity * record["max_replicas"] >= args.peak
+            color = Fore.GREEN if enough else Fore.YELLOW
+            bound = "" if record["saturated"] else "at least "
+            recommended = record["recommended_replicas"]
+            autoscale = record["autoscale"]
+            if autoscale:
+                advice = (
+                    f"an autoscale max of {recommended} for {args.peak} at peak "
+                    f"(currently {autoscale['min']}-{autoscale['max']})"
+                )
+            else:
+                advice = (
+                    f"{recommended} replicas for {args.peak} at peak "
+                    f"(currently {record['replicas']})"
+                )
+            print(
+                f"{color}✓ {bound}{capacity} connections per replica, so "
+                f"{advice}{Style.RESET_ALL}"
+            )
+
+    if reporter is not None:
+        reporter.close()
+    return success
+
+
+def print_load_stage(stage: Dict[str, Any], target_latency: float):
+    p99 = stage["latency_p99"]
+    color = Fore.GREEN if p99 is not None and p99 <= target_latency else Fore.RED
+    print(
+        f"  {stage['concurrency']:>5} connections: "
+        f"{stage['throughput']:8.1f} req/s, "
+        f"{stage['error_rate'] * 100:5.1f}% errors, "
+        f"p50 {format_latency(stage['latency_p50'])}, "
+        f"{color}p99 {format_latency(p99)}{Style.RESET_ALL}"
+    )
+
+
+def upgrade(args):
+    import requests
+
+    # download new code
+    source_code = requests.get(UPSTREAM).text
+
+    # write code
+    path = os.path.realpath(__file__)
+    with open(path, "w") as ctftool:
+        ctftool.write(source_code)
+
+
+def challenge_record(challenge: "Challenge", brief: bool = False) -> Dict[str, Any]:
+    """
+    Summarize a challenge for machine readable output.
+    """
+
+    record: Dict[str, Any] = {
+        "path": challenge.path,
+        "name": challenge.name,
+    }
+    if challenge.error is not None:
+        record["error"] = str(challenge.error)
+    elif not brief:
+        record.update(
+            {
+                "display": challenge.display,
+                "category": challenge.category,
+                "description": challenge.description,
+                "points": challenge.points,
+                "flags": challenge.flags,
+                "files": challenge.files,
+                "state": challenge.state,
+            }
+        )
+    record["parse_time"] = challenge.parse_time
+    return record
+
+
+class Reporter:
+    """
+    Streams machine readable records to stdout, one per challenge.
+
+    For json, the records are written as an array, one element per line, so
+    that the output is valid JSON once complete. For ndjson, each line is a
+    complete document by itself.
+    """
+
+    def __init__(self, format: str):
+        import threading
+
+        self.format = format
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]):
+        line = json.dumps(record)
+        with self.lock:
+            if self.format == "json":
+                line = ("[" if self.count == 0 else ",") + line
+            print(line, flush=True)
+            self.count += 1
+
+    def close(self):
+        if self.format == "json":
+            print("[]" if self.count == 0 else "]", flush=True)
+
+    def __enter__(self) -> "Reporter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Record:
+    """
+    Base for the slotted, read-only records of the challenge data model.
+
+    Subclasses list their schema fields (in constructor order) in FIELDS,
+    which define equality and hashing, and the few attributes that may
+    change after loading (such as state fetched from a server) in MUTABLE.
+    Every other attribute is fixed once constructed - use replace to derive
+    a modified copy.
+    """
+
+    __slots__ = ()
+
+    FIELDS: Tuple[str, ...] = ()
+    MUTABLE: Tuple[str, ...] = ()
+
+    def __setattr__(self, name: str, value: Any):
+        if name not in self.MUTABLE:
+            raise AttributeError(f"{type(self).__name__}.{name} is read-only")
+        _setattr(self, name, value)
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"{type(self).__name__}.{name} is read-only")
+
+    def _fields(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self) -> int:
+        return hash(_freeze(self._fields()))
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}" for field in self.FIELDS
+        )
+        return f"{type(self).__name__}({fields})"
+
+    # pickle sets slots with setattr, which would trip the read-only check,
+    # so records (such as those sent to worker processes) are rebuilt here
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            slot: getattr(self, slot)
+            for slot in type(self).__slots__
+            if hasattr(self, slot)
+        }
+
+    def __setstate__(self, state: Dict[str, Any]):
+        for slot, value in state.items():
+            _setattr(self, slot, value)
+
+    def replace(self, **changes: Any) -> Any:
+        fields = {field: getattr(self, field) for field in self.FIELDS}
+        fields.update(changes)
+        return type(self)(**fields)
+
+
+# records set their own (read-only) attributes through this
+_setattr = object.__setattr__
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Convert nested lists and dicts into something hashable.
+    """
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    elif isinstance(value, dict):
+        return frozenset((key, _freeze(item)) for key, item in value.items())
+    return value
+
+
+def _sequence(value: Any) -> Any:
+    # malformed values (like a single string instead of a list) are kept
+    # as-is, so that validation can complain about them
+    if value is None:
+        return ()
+    elif isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _plain(value: Any) -> Any:
+    # the inverse of _sequence, copying any dicts (but again leaving malformed
+    # values as they are, so that they round-trip)
+    if isinstance(value, tuple):
+        return [_plain(item) for item in value]
+    elif isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+class Challenge(Record):
+    """
+    Interface to the challenge files and their contained data.
+    """
+
+    FIELDS = (
+        "name",
+        "display",
+        "category",
+        "path",
+        "description",
+        "points",
+        "flags",
+        "files",
+        "hints",
+        "generate",
+        "requirements",
+        "deploy",
+        "state",
+    )
+
+    # the id assigned by CTFd, and details about how this was loaded
+    MUTABLE = ("id", "error", "parse_time", "_githash", "_githash_resolved")
+
+    __slots__ = FIELDS + MUTABLE
+
+    def __init__(
+        self,
+        name: str,
+        display: str,
+        category: str,
+        path: Optional[str] = None,
+        description: str = "",
+        points: int = 0,
+        flags: Iterable[str] = None,
+        files: Iterable[str] = None,
+        hints: Iterable[Dict[str, Any]] = None,
+        generate: Dict[str, str] = None,
+        requirements: Iterable[str] = None,
+        deploy: "Deploy" = None,
+        state: str = "visible",
+    ):
+        _setattr(self, "name", name)
+        _setattr(self, "display", display)
+        _setattr(self, "category", category)
+        _setattr(self, "path", path)
+        _setattr(self, "description", description)
+        _setattr(self, "points", points)
+        _setattr(self, "flags", _sequence(flags))
+        _setattr(self, "files", _sequence(files))
+        _setattr(self, "hints", _sequence(hints))
+        _setattr(self, "generate", generate or {})
+        _setattr(self, "requirements", _sequence(requirements))
+        _setattr(self, "deploy", deploy)
+        _setattr(self, "state", state)
+
+        self.id: Optional[int] = None
+        self.error: Optional[Exception] = None
+        self.parse_time = 0.0
+
+        self._githash: Optional[str] = None
+        self._githash_resolved = False
+
+    @property
+    def githash(self) -> Optional[str]:
+        if not self._githash_resolved:
+            Challenge.resolve_githashes([self])
+        return self._githash
+
+    @staticmethod
+    def resolve_githashes(challenges: Iterable["Challenge"]):
+        """
+        Find the last commit touching each challenge's directory.
+
+        Rather than running git once per challenge, this walks the history
+        once for all of them, stopping as soon as every challenge has been
+        seen. The results are memoized on the challenges.
+        """
+
+        import subprocess
+
+        pending: Dict[str, List[Challenge]] = {}
+        for challenge in challenges:
+            challenge._githash = None
+            challenge._githash_resolved = True
+            if challenge.path is not None:
+                directory = os.path.normpath(os.path.dirname(challenge.path))
+                pending.setdefault(directory, []).append(challenge)
+        if not pending:
+            return
+
+        proc = subprocess.Popen(
+            [
+                "git",
+                "log",
+                "--pretty=format:%x00%h",
+                "--name-only",
+                "--relative",
+                "--",
+                *pending,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        try:
+            commit = None
+            for line in proc.stdout:
+                line = line.rstrip("\n")
+                if line.startswith("\0"):
+                    commit = line[1:]
+                    continue
+                elif not line or commit is None:
+                    continue
+
+                # the commit touches every challenge above the file
+                directory = os.path.dirname(os.path.normpath(line))
+                while directory:
+                    for challenge in pending.pop(directory, []):
+                        challenge._githash = commit
+                    directory = os.path.dirname(directory)
+                for challenge in pending.pop(".", []):
+                    challenge._githash = commit
+
+                if not pending:
+                    break
+        finally:
+            proc.kill()
+            proc.wait()
+            proc.stdout.close()
+
+    @staticmethod
+    def load_all(
+        suppress_errors: bool = False, cache: bool = True
+    ) -> Iterable["Challenge"]:
+        globpath = "challenges/**/challenge.*"
+        paths = glob.glob(globpath, recursive=True)
+
+        if cache:
+            parsed = ParseCache().parse_all(paths)
+        else:
+            parsed = {}
+
+        for path in paths:
+            data, parse_time = parsed.get(path, (None, 0.0))
+
+            start = time.perf_counter()
+            challenge = Challenge.load(path, suppress_errors, data)
+            challenge.parse_time = parse_time + time.perf_counter() - start
+            yield challenge
+
+    @staticmethod
+    def load(
+        filename: str, suppress_errors: bool = False, data: Optional[Any] = None
+    ) -> "Challenge":
+        try:
+            return Challenge._load(filename, data)
+        except Exception as e:
+            if suppress_errors:
+                challenge = Challenge("", "", "", path=filename)
+                challenge.error = e
+                return challenge
+            else:
+                raise
+
+    @staticmethod
+    def _load(filename: str, data: Optional[Any] = None) -> "Challenge":
+        if data is None:
+            data = parse_file(filename)
+
+        return Challenge.from_dict(data, path=filename)
+
+    @staticmethod
+    def _load_dict(data: Dict[str, Any]) -> "Challenge":
+        return Challenge.from_dict(data)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any], path: Optional[str] = None) -> "Challenge":
+        return Challenge(
+            name=data.get("name", ""),
+            display=data.get("display", ""),
+            category=data.get("category", ""),
+            path=path,
+            description=data.get("description", ""),
+            points=data.get("points", 0),
+            flags=data.get("flags", []),
+            files=data.get("files", []),
+            hints=data.get("hints", []),
+            generate=data.get("generate", {}),
+            requirements=data.get("requirements", []),
+            deploy=Deploy.from_dict(data.get("deploy", {})),
+            state=data.get("state", "visible"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert back into the challenge file schema (without the path, which
+        isn't part of it).
+        """
+
+        data = {
+            "name": self.name,
+            "display": self.display,
+            "category": self.category,
+            "description": self.description,
+            "points": self.points,
+            "flags": _plain(self.flags),
+            "files": _plain(self.files),
+            "hints": _plain(self.hints),
+            "generate": _plain(self.generate),
+            "requirements": _plain(self.requirements),
+            "state": self.state,
+        }
+        if self.deploy is not None:
+            data["deploy"] = self.deploy.to_dict()
+        return data
+
+
+class Deploy(Record):
+    FIELDS = (
+        "docker",
+        "replicas",
+        "env",
+        "ports",
+        "resources",
+        "readiness",
+        "liveness",
+        "autoscale",
+    )
+    __slots__ = FIELDS
+
+    def __init__(
+        self,
+        docker: bool = False,
+        replicas: int = 1,
+        env: Iterable[str] = None,
+        ports: Iterable["Port"] = None,
+        resources: Optional["Resources"] = None,
+        readiness: Optional["Probe"] = None,
+        liveness: Optional["Probe"] = None,
+        autoscale: Optional["Autoscale"] = None,
+    ):
+        _setattr(self, "docker", docker)
+        _setattr(self, "replicas", replicas)
+        _setattr(self, "env", _sequence(env))
+        _setattr(self, "ports", _sequence(ports))
+        _setattr(self, "resources", resources)
+        _setattr(self, "readiness", readiness)
+        _setattr(self, "liveness", liveness)
+        _setattr(self, "autoscale", autoscale)
+
+    @property
+    def min_replicas(self) -> int:
+        """
+        The fewest replicas that should ever be running.
+        """
+
+        if self.autoscale is not None:
+            return self.autoscale.min
+        return self.replicas
+
+    @staticmethod
+    def _load_dict(data: Dict[str, Any]) -> "Deploy":
+        return Deploy.from_dict(data)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Deploy":
+        def optional(cls, key):
+            value = data.get(key)
+            return None if value is None else cls.from_dict(value)
+
+        return Deploy(
+            docker=data.get("docker", False),
+            replicas=data.get("replicas", 1),
+            env=data.get("env", []),
+            ports=[Port.from_dict(port) for port in data.get("ports", [])],
+            resources=optional(Resources, "resources"),
+            readiness=optional(Probe, "readiness"),
+            liveness=optional(Probe, "liveness"),
+            autoscale=optional(Autoscale, "autoscale"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "docker": self.docker,
+            "replicas": self.replicas,
+            "env": _plain(self.env),
+            "ports": [port.to_dict() for port in self.ports],
+        }
+        for key in ("resources", "readiness", "liveness", "autoscale"):
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value.to_dict()
+        return data
+
+
+class Port(Record):
+    FIELDS = ("internal", "external", "protocol")
+    __slots__ = FIELDS
+
+    def __init__(self, internal: int, external: int, protocol: str = "tcp"):
+        _setattr(self, "internal", internal)
+        _setattr(self, "external", external)
+        _setattr(self, "protocol", protocol)
+
+    @staticmethod
+    def _load_dict(data: Dict[str, Any]) -> "Port":
+        return Port.from_dict(data)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Port":
+        return Port(
+            internal=data.get("internal", 0),
+            external=data.get("external", 0),
+            protocol=data.get("protocol", "tcp"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "internal": self.internal,
+            "external": self.external,
+            "protocol": self.protocol,
+        }
+
+    def __repr__(self) -> str:
+        return f"<Port {self.external}:{self.internal}/{self.protocol}>"
+
+    def __str__(self) -> str:
+        return repr(self)
+
+
+class Resources(Record):
+    """
+    Compute resources for each replica, as maps of "cpu" and "memory" to
+    kubernetes-style quantities (like 250m or 128Mi).
+    """
+
+    FIELDS = ("requests", "limits")
+    __slots__ = FIELDS
+
+    def __init__(self, requests: Dict[str, Any] = None, limits: Dict[str, Any] = None):
+        _setattr(self, "requests", requests or {})
+        _setattr(self, "limits", limits or {})
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Resources":
+        return Resources(
+            requests=data.get("requests", {}),
+            limits=data.get("limits", {}),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"requests": dict(self.requests), "limits": dict(self.limits)}
+
+
+class Probe(Record):
+    """
+    Health check for a replica - a HTTP GET of path if one is given, or
+    otherwise just opening a TCP connection to the (internal) port.
+    """
+
+    FIELDS = ("port", "path", "delay", "period")
+    __slots__ = FIELDS
+
+    def __init__(
+        self, port: int, path: Optional[str] = None, delay: int = 0, period: int = 10
+    ):
+        _setattr(self, "port", port)
+        _setattr(self, "path", path)
+        _setattr(self, "delay", delay)
+        _setattr(self, "period", period)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Probe":
+        return Probe(
+            port=data.get("port", 0),
+            path=data.get("path"),
+            delay=data.get("delay", 0),
+            period=data.get("period", 10),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"port": self.port, "delay": self.delay, "period": self.period}
+        if self.path is not None:
+            data["path"] = self.path
+        return data
+
+
+class Autoscale(Record):
+    """
+    Bounds on the number of replicas, scaled to keep the average CPU usage
+    at target percent of the requested CPU.
+    """
+
+    FIELDS = ("min", "max", "target")
+    __slots__ = FIELDS
+
+    def __init__(self, min: int = 1, max: int = 1, target: int = 80):
+        _setattr(self, "min", min)
+        _setattr(self, "max", max)
+        _setattr(self, "target", target)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Autoscale":
+        return Autoscale(
+            min=data.get("min", 1),
+            max=data.get("max", 1),
+            target=data.get("target", 80),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"min": self.min, "max": self.max, "target": self.target}
+
+
+class ChallengeLoadError(RuntimeError):
+    pass
+
+
+class ParseCache:
+    """
+    Persistent cache of parsed challenge files.
+
+    Entries are keyed on the path, and invalidated by the file's mtime and
+    size, so that a warm cache never has to touch the YAML parser. Files that
+    are missing from the cache are parsed in parallel.
+    """
+
+    PATH = os.path.join(CACHE_DIR, "challenges.json")
+    VERSION = 1
+
+    # below this many files, the cost of starting worker processes outweighs
+    # the cost of just parsing them
+    PARALLEL_THRESHOLD = 32
+
+    def __init__(self, path: str = PATH):
+        self.path = path
+
+        data = read_cache(self.path)
+        if data.get("version") == self.VERSION:
+            self.entries = data.get("entries", {})
+        else:
+            self.entries = {}
+
+    def parse_all(self, paths: List[str]) -> Dict[str, Tuple[Any, float]]:
+        results = {}
+        stats = {}
+        misses = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stats[path] = [st.st_mtime_ns, st.st_size]
+
+            entry = self.entries.get(path)
+            if entry is not None and entry["stat"] == stats[path]:
+                results[path] = (entry["data"], 0.0)
+            else:
+                misses.append(path)
+
+        for path, (data, parse_time) in zip(misses, self._parse(misses)):
+            if not isinstance(data, dict):
+                # leave errors to be reported when loading the challenge
+                continue
+            results[path] = (data, parse_time)
+
+            try:
+                if json.loads(json.dumps(data)) != data:
+                    raise ValueError("data does not roundtrip")
+            except (TypeError, ValueError):
+                # some yaml types can't be represented in the cache
+                continue
+            self.entries[path] = {"stat": stats[path], "data": data}
+
+        removed = set(self.entries) - set(stats)
+        for path in removed:
+            del self.entries[path]
+
+        if misses or removed:
+            self.save()
+
+        return results
+
+    def _parse(self, paths: List[str]) -> List[Tuple[Any, float]]:
+        return map_in_processes(
+            _parse_file_safe, paths, threshold=self.PARALLEL_THRESHOLD, chunksize=16
+        )
+
+    def save(self):
+        data = {"version": self.VERSION, "entries": self.entries}
+        write_cache(self.path, data)
+
+
+class Watcher(abc.ABC):
+    """
+    Watches a directory tree, reporting the paths of files that change.
+    """
+
+    # once something changes, wait this long for any related changes (editors
+    # often write files in several steps)
+    SETTLE = 0.05
+
+    @staticmethod
+    def create(root: str, poll: bool = False, interval: float = 0.5) -> "Watcher":
+        if not poll:
+            try:
+                return InotifyWatcher(root)
+            except OSError:
+                pass
+        return PollingWatcher(root, interval)
+
+    @abc.abstractmethod
+    def wait(self) -> set:
+        """
+        Block until something changes, returning the changed paths.
+        """
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(Watcher):
+    """
+    Watcher using linux's inotify, through ctypes.
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    MASK = (
+        IN_MODIFY
+        | IN_ATTRIB
+        | IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+    )
+
+    def __init__(self, root: str):
+        import ctypes
+        import ctypes.util
+
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("could not find libc")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.watches: Dict[int, str] = {}
+        self._add_tree(root)
+
+    def _add_tree(self, root: str) -> set:
+        files = set()
+        for directory, _, filenames in os.walk(root):
+            directory = os.path.normpath(directory)
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), self.MASK
+            )
+            if wd >= 0:
+                self.watches[wd] = directory
+            files.update(os.path.join(directory, name) for name in filenames)
+        return files
+
+    def wait(self) -> set:
+        import select
+        import struct
+
+        changed = set()
+        timeout = None
+        while select.select([self.fd], [], [], timeout)[0]:
+            data = os.read(self.fd, 1 << 16)
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+                offset += struct.calcsize("iIII")
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+
+                directory = self.watches.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+
+                if mask & self.IN_ISDIR:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        # new directories need watching too, and might already
+                        # contain files
+                        changed.update(self._add_tree(path))
+                else:
+                    changed.add(path)
+
+            timeout = self.SETTLE
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    """
+    Fallback watcher, that repeatedly compares snapshots of the tree.
+    """
+
+    def __init__(self, root: str, interval: float = 0.5):
+        self.root = root
+        self.interval = interval
+        self.snapshot = self._snapshot()
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.normpath(os.path.join(directory, filename))
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def wait(self) -> set:
+        while True:
+            time.sleep(self.interval)
+            snapshot = self._snapshot()
+            changed = {
+                path
+                for path in set(snapshot) | set(self.snapshot)
+                if snapshot.get(path) != self.snapshot.get(path)
+            }
+            self.snapshot = snapshot
+            if changed:
+                return changed
+
+
+class ProbeTarget:
+    """
+    A single challenge port to probe, over HTTP if path is set, or otherwise
+    as a plain TCP service.
+    """
+
+    def __init__(self, challenge: str, host: str, port: int, path: Optional[str]):
+        self.challenge = challenge
+        self.host = host
+        self.port = port
+        self.path = path
+
+    @property
+    def protocol(self) -> str:
+        return "tcp" if self.path is None else "http"
+
+
+class ProbeResult:
+    __slots__ = ("ok", "connect", "first_byte", "total", "status", "error")
+
+    def __init__(self):
+        self.ok = False
+        self.connect: Optional[float] = None
+        self.first_byte: Optional[float] = None
+        self.total: Optional[float] = None
+        self.status: Optional[int] = None
+        self.error: Optional[str] = None
+
+
+def probe_targets(
+    challenges: Iterable["Challenge"], host: str, internal: bool, http: bool
+) -> List[ProbeTarget]:
+    targets = []
+    for challenge in challenges:
+        deploy = challenge.deploy
+        if deploy is None or not deploy.docker:
+            continue
+
+        # ports with an HTTP health check are known to speak HTTP
+        paths = {
+            probe.port: probe.path
+            for probe in (deploy.liveness, deploy.readiness)
+            if probe is not None and probe.path
+        }
+        for port in deploy.ports:
+            if port.protocol.lower() != "tcp":
+                continue
+            path = paths.get(port.internal, "/" if http else None)
+            number = port.internal if internal else port.external
+            targets.append(ProbeTarget(challenge.name, host, number, path))
+    return targets
+
+
+async def probe_once(
+    target: ProbeTarget,
+    timeout: float = 5,
+    read_timeout: float = 1,
+    drain: bool = False,
+) -> ProbeResult:
+    """
+    Connect to a target, timing the connection and the first byte of its
+    response (to a HTTP GET, or of a greeting, for plain TCP services).
+
+    With drain, HTTP responses are read to the end, so that total covers
+    the whole request rather than just its first byte.
+    """
+
+    import asyncio
+
+    result = ProbeResult()
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(target.host, target.port), timeout
+        )
+    except (OSError, asyncio.TimeoutError) as e:
+        result.error = describe_error(e)
+        return result
+    result.connect = time.perf_counter() - start
+
+    try:
+        sent = time.perf_counter()
+        if target.path is not None:
+            writer.write(
+                (
+                    f"GET {target.path} HTTP/1.1\r\n"
+                    f"Host: {target.host}\r\n"
+                    "User-Agent: ctftool\r\n"
+                    "Connection: close\r\n"
+                    "\r\n"
+                ).encode()
+            )
+            await writer.drain()
+            sent = time.perf_counter()
+
+            first = await asyncio.wait_for(reader.read(1), timeout)
+            if not first:
+                raise ConnectionError("connection closed")
+            result.first_byte = time.perf_counter() - sent
+
+            line = first + await asyncio.wait_for(reader.readline(), timeout)
+            parts = line.split()
+            if len(parts) < 2 or not parts[1].isdigit():
+                raise ConnectionError("invalid HTTP response")
+            result.status = int(parts[1])
+            if result.status >= 500:
+                raise ConnectionError(f"HTTP {result.status}")
+            if drain:
+                while await asyncio.wait_for(reader.read(65536), timeout):
+                    pass
+        else:
+            # netcat-style services usually greet first, but a quiet one that
+            # keeps the connection open is still up
+            try:
+                first = await asyncio.wait_for(reader.read(1), read_timeout)
+            except asyncio.TimeoutError:
+                first = None
+            if first == b"":
+                raise ConnectionError("connection closed")
+            elif first:
+                result.first_byte = time.perf_counter() - sent
+        result.ok = True
+        # a quiet service's session ends at the connect, not after waiting
+        # out the read timeout
+        result.total = result.connect + (result.first_byte or 0)
+        if drain and target.path is not None:
+            result.total = time.perf_counter() - start
+    except (OSError, asyncio.TimeoutError) as e:
+        result.error = describe_error(e)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    return result
+
+
+async def run_probes(
+    targets: List[ProbeTarget],
+    count: int = 5,
+    interval: float = 0.5,
+    timeout: float = 5,
+    read_timeout: float = 1,
+    concurrency: int = 64,
+) -> List[List[ProbeResult]]:
+    """
+    Probe every target count times, all concurrently (up to a limit).
+    """
+
+    import asyncio
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results: List[List[ProbeResult]] = [[] for _ in targets]
+
+    async def probe(i, target):
+        for n in range(count):
+            if n:
+                await asyncio.sleep(interval)
+            async with semaphore:
+                results[i].append(await probe_once(target, timeout, read_timeout))
+
+    await asyncio.gather(*(probe(i, target) for i, target in enumerate(targets)))
+    return results
+
+
+def probe_record(target: ProbeTarget, results: List[ProbeResult]) -> Dict[str, Any]:
+    connects = sorted(r.connect for r in results if r.ok and r.connect is not None)
+    firsts = sorted(r.first_byte for r in results if r.ok and r.first_byte is not None)
+    errors = [r.error for r in results if r.error is not None]
+    return {
+        "challenge": target.challenge,
+        "host": target.host,
+        "port": target.port,
+        "protocol": target.protocol,
+        "path": target.path,
+        "probes": len(results),
+        "successes": sum(1 for r in results if r.ok),
+        "connect_p50": percentile(connects, 50) if connects else None,
+        "connect_p99": percentile(connects, 99) if connects else None,
+        "first_byte_p50": percentile(firsts, 50) if firsts else None,
+        "first_byte_p99": percentile(firsts, 99) if firsts else None,
+        "connect_sum": sum(connects),
+        "first_byte_sum": sum(firsts),
+        "first_byte_count": len(firsts),
+        "error": errors[-1] if errors else None,
+    }
+
+
+def format_prometheus(records: List[Dict[str, Any]]) -> str:
+    """
+    Render probe records in the Prometheus text exposition format, suitable
+    for node_exporter's textfile collector.
+    """
+
+    lines = [
+        "# HELP ctftool_probe_up Whether every probe of a challenge succeeded.",
+        "# TYPE ctftool_probe_up gauge",
+    ]
+    for record in records:
+        up = 1 if record["successes"] == record["probes"] else 0
+        lines.append(f"ctftool_probe_up{{{prometheus_labels(record)}}} {up}")
+
+    lines += [
+        "# HELP ctftool_probe_success_ratio Fraction of probes that succeeded.",
+        "# TYPE ctftool_probe_success_ratio gauge",
+    ]
+    for record in records:
+        ratio = record["successes"] / record["probes"] if record["probes"] else 0
+        lines.append(
+            f"ctftool_probe_success_ratio{{{prometheus_labels(record)}}} {ratio:g}"
+        )
+
+    for name, help in (
+        ("connect", "Time to open a connection."),
+        ("first_byte", "Time from sending a request to the first byte back."),
+    ):
+        metric = f"ctftool_probe_{name}_seconds"
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} summary"]
+        for record in records:
+            labels = prometheus_labels(record)
+            for quantile, key in (("0.5", "p50"), ("0.99", "p99")):
+                value = record[f"{name}_{key}"]
+                if value is not None:
+                    lines.append(
+                        f'{metric}{{{labels},quantile="{quantile}"}} {value:.6f}'
+                    )
+            count = (
+                record["first_byte_count"]
+                if name == "first_byte"
+                else record["successes"]
+            )
+            lines.append(f"{metric}_sum{{{labels}}} {record[f'{name}_sum']:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def prometheus_labels(record: Dict[str, Any]) -> str:
+    return (
+        f'challenge="{record["challenge"]}",'
+        f'port="{record["port"]}",'
+        f'protocol="{record["protocol"]}"'
+    )
+
+
+def describe_error(error: BaseException) -> str:
+    # timeouts have no message of their own
+    return str(error) or type(error).__name__
+
+
+async def run_load(
+    target: ProbeTarget,
+    concurrency: int,
+    duration: float = 10,
+    timeout: float = 5,
+    read_timeout: float = 1,
+) -> Dict[str, Any]:
+    """
+    Hold a number of connections open against a target for a while, each
+    reconnecting as soon as its last session (a full HTTP request, or a TCP
+    connection and greeting) ends.
+    """
+
+    import asyncio
+
+    results: List[ProbeResult] = []
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            result = await probe_once(target, timeout, read_timeout, drain=True)
+            results.append(result)
+            if not result.ok:
+                # don't spin on an instantly refused connection
+                await asyncio.sleep(0.01)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r.total for r in results if r.ok and r.total is not None)
+    errors = sum(1 for r in results if not r.ok)
+    return {
+        "concurrency": concurrency,
+        "duration": elapsed,
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": errors / len(results) if results else 1.0,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 50) if latencies else None,
+        "latency_p99": percentile(latencies, 99) if latencies else None,
+    }
+
+
+def stage_healthy(
+    stage: Dict[str, Any], target_latency: float, max_error_rate: float
+) -> bool:
+    p99 = stage["latency_p99"]
+    return (
+        p99 is not None
+        and p99 <= target_latency
+        and stage["error_rate"] <= max_error_rate
+    )
+
+
+def load_record(
+    target: ProbeTarget,
+    stages: List[Dict[str, Any]],
+    deploy: "Deploy",
+    peak: int,
+    target_latency: float,
+    max_error_rate: float,
+) -> Dict[str, Any]:
+    """
+    Summarize a load test, recommending enough replicas to hold the peak
+    number of connections, at the most each replica handled while staying
+    within the targets.
+
+    For autoscaled challenges, the recommendation is for the top of the
+    range (which is never below its bottom).
+    """
+
+    capacity = max(
+        (
+            stage["concurrency"]
+            for stage in stages
+            if stage_healthy(stage, target_latency, max_error_rate)
+        ),
+        default=None,
+    )
+    return {
+        "challenge": target.challenge,
+        "host": target.host,
+        "port": target.port,
+        "protocol": target.protocol,
+        "stages": stages,
+        "target_latency": target_latency,
+        "max_error_rate": max_error_rate,
+        "peak": peak,
+        "capacity": capacity,
+        # otherwise, the ramp stopped before finding the real capacity
+        "saturated": bool(stages)
+        and not stage_healthy(stages[-1], target_latency, max_error_rate),
+        "replicas": deploy.replicas,
+        "autoscale": deploy.autoscale.to_dict() if deploy.autoscale else None,
+        # the most replicas that can be running at peak
+        "max_replicas": (
+            deploy.autoscale.max if deploy.autoscale else deploy.replicas
+        ),
+        "recommended_replicas": (
+            max(deploy.min_replicas, 1, math.ceil(peak / capacity))
+            if capacity
+            else None
+        ),
+    }
+
+
+def format_latency(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}ms"
+
+
+class ValidateCache:
+    """
+    Results of validating each challenge, so that unchanged challenges don't
+    need to be checked again.
+
+    A result is reused as long as the challenge file is unchanged, and so
+    are the directories containing its files (whose mtimes change whenever
+    a file is created or removed in them).
+    """
+
+    PATH = os.path.join(CACHE_DIR, "validate.json")
+
+    # bump this whenever check_challenge changes
+    VERSION = 2
+
+    def __init__(self, path: str = PATH):
+        self.path = path
+
+        data = read_cache(self.path)
+        if data.get("version") == self.VERSION:
+            self.entries = data.get("entries", {})
+        else:
+            self.entries = {}
+        self.seen = set()
+
+    @staticmethod
+    def fingerprint(challenge: "Challenge") -> List[Any]:
+        def stat(path):
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            return [st.st_mtime_ns, st.st_size]
+
+        directory = os.path.dirname(challenge.path)
+        directories = {
+            os.path.dirname(os.path.join(directory, filename))
+            for filename in challenge.files
+        }
+        return [stat(challenge.path)] + [
+            [path, stat(path)] for path in sorted(directories)
+        ]
+
+    def get(self, path: str, fingerprint: List[Any]) -> Optional[List[str]]:
+        entry = self.entries.get(path)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        return entry["errors"]
+
+    def set(self, path: str, fingerprint: List[Any], errors: List[str]):
+        self.entries[path] = {"fingerprint": fingerprint, "errors": list(errors)}
+        self.seen.add(path)
+
+    def keep(self, path: str):
+        self.seen.add(path)
+
+    def save(self):
+        entries = {path: self.entries[path] for path in self.seen}
+        write_cache(self.path, {"version": self.VERSION, "entries": entries})
+
+
+class GenerateCache:
+    """
+    Record of the inputs that each generated file was created from.
+
+    A file is up to date if it was generated by the same command, from a
+    challenge directory with the same contents - much like make.
+    """
+
+    PATH = os.path.join(CACHE_DIR, "generate.json")
+
+    def __init__(self, path: str = PATH):
+        import threading
+
+        self.path = path
+        self.entries = read_cache(self.path)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(command: str, dirhash: str) -> str:
+        import hashlib
+
+        return hashlib.sha1(f"{command}\0{dirhash}".encode()).hexdigest()
+
+    def get(self, path: str) -> Optional[str]:
+        with self.lock:
+            return self.entries.get(path)
+
+    def set(self, path: str, key: str):
+        with self.lock:
+            self.entries[path] = key
+
+    def save(self):
+        with self.lock:
+            write_cache(self.path, self.entries, indent=2, sort_keys=True)
+
+
+def parse_file(filename: str) -> Any:
+    with open(filename) as f:
+        ext = os.path.splitext(filename)[-1]
+        if ext == ".yaml" or ext == ".yml":
+            import yaml
+
+            loader, _ = yaml_classes()
+            return yaml.load(f, Loader=loader)
+        elif ext == ".json":
+            return json.load(f)
+        else:
+            raise ChallengeLoadError(f'unknown file extension "{ext}"')
+
+
+def _parse_file_safe(filename: str) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    try:
+        data = parse_file(filename)
+    except Exception:
+        data = None
+    return data, time.perf_counter() - start
+
+
+def read_cache(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+def write_cache(path: str, data: Any, **kwargs):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f, **kwargs)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        # caches are an optimization, so don't fail if we can't write them
+        pass
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """
+    Write a file only if its content has changed, so that timestamps (and
+    anything watching them) only move when they need to. Returns whether the
+    file was written.
+    """
+
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+
+    with open(path, "w") as f:
+        f.write(content)
+    return True
+
+
+def dump_yaml(data: Any) -> str:
+    import yaml
+
+    _, dumper = yaml_classes()
+    return yaml.dump(data, Dumper=dumper)
+
+
+def yaml_classes() -> Tuple[type, type]:
+    """
+    The safe yaml loader and dumper, preferring the libyaml bindings (which
+    are much faster) when they're available.
+    """
+
+    import yaml
+
+    return (
+        getattr(yaml, "CSafeLoader", yaml.SafeLoader),
+        getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+    )
+
+
+def map_in_processes(
+    func: Callable[[Any], Any],
+    items: List[Any],
+    threshold: int = 2,
+    chunksize: int = 1,
+) -> List[Any]:
+    """
+    Map a function over items, in worker processes if there are at least
+    threshold of them (and more than one cpu to run them on).
+
+    The function must be picklable, so defined at the top level of a module.
+    """
+
+    if len(items) >= threshold and (os.cpu_count() or 1) > 1:
+        import concurrent.futures.process
+
+        try:
+            with concurrent.futures.ProcessPoolExecutor() as executor:
+                return list(executor.map(func, items, chunksize=chunksize))
+        except (OSError, concurrent.futures.process.BrokenProcessPool):
+            # some environments can't start worker processes
+            pass
+
+    return [func(item) for item in items]
+
+
+class CTFd:
+    """
+    Client for CTFd server.
+
+    This has been tested with CTFd 3.0.0 on API v1 and should continue
+    to work in the future, as long as the API doesn't change too much.
+    """
+
+    ENDPOINTS = {"flag": "flags", "hint": "hints", "file": "files"}
+
+    # responses worth retrying: rate limiting, and the reverse proxy failing
+    # to reach an overloaded CTFd
+    RETRY_STATUSES = {429, 502, 503, 504}
+    IDEMPOTENT_METHODS = {"get", "head", "options", "put", "patch", "delete"}
+
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        connections: int = 1,
+        manifest: Optional["FileManifest"] = None,
+        retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        timeout: Tuple[float, float] = (10, 120),
+    ):
+        import threading
+
+        import requests
+        import requests.adapters
+
+        self.base = url
+        self.session = requests.Session()
+        self.manifest = manifest
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.metrics = Metrics()
+
+        # per-thread counters, so that concurrent uploads can be measured
+        self._local = threading.local()
+
+        # limit the number of requests in flight, so that parallel uploads
+        # don't overwhelm the server
+        self.concurrency = threading.BoundedSemaphore(max(connections, 1))
+
+        # the session is shared between worker threads, so the pool needs
+        # to be large enough to give each of them a connection
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(connections, 1), pool_block=True
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.session.headers.update({"Authorization": f"Token {token}"})
+
+    def list(self) -> List[Any]:
+        return self._request("get", "/api/v1/challenges?view=admin", json={})
+
+    def upload(self, challenge: Challenge) -> int:
+        # create challenge
+        data = self._challenge_data(challenge)
+        resp_data = self._request("post", "/api/v1/challenges", json=data)
+        challenge_id = int(resp_data["id"])
+
+        self._upload_parts(challenge_id, challenge)
+
+        return challenge_id
+
+    def requirements(
+        self,
         challenge: Challenge,
         challenges: Dict[str, Challenge],
     ):
@@ -446,18 +2553,254 @@ class CTFd:
         for req in challenge.requirements:
             prerequisites.append(challenges[req].id)
 
-        # patch the requirements
+        # patch the requirements, if they differ from the server's
         if prerequisites:
-            data = {"requirements": {"prerequisites": prerequisites}}
-            resp = self.session.patch(
-                f"{self.base}/api/v1/challenges/{challenge.id}",
-                json=data,
+            online = self._request(
+                "get", f"/api/v1/challenges/{challenge.id}/requirements"
             )
-            resp.raise_for_status()
+            online = (online or {}).get("prerequisites", [])
+            if sorted(online) == sorted(prerequisites):
+                return
+
+            data = {"requirements": {"prerequisites": prerequisites}}
+            self._request("patch", f"/api/v1/challenges/{challenge.id}", json=data)
 
     def reupload(self, challenge_id: int, challenge: Challenge) -> int:
-        # patch challenge
+        changes = self.plan(challenge_id, challenge)
+        self.apply(challenge_id, changes)
+
+        return challenge_id
+
+    def plan(self, challenge_id: Optional[int], challenge: Challenge) -> List["Change"]:
+        """
+        Determine the minimal list of changes needed to make the challenge on
+        the server match the local challenge.
+
+        If the challenge_id is None, then the challenge is assumed not to
+        exist yet, and the plan will create it from scratch.
+        """
+
+        if challenge_id is None:
+            changes = [Change("create", "challenge", self._challenge_data(challenge))]
+            changes.extend(self._diff_parts(challenge, {}))
+            return changes
+
+        remote = {
+            "challenge": self._request("get", f"/api/v1/challenges/{challenge_id}"),
+            "flags": self._request("get", f"/api/v1/challenges/{challenge_id}/flags"),
+            "hints": self._request("get", f"/api/v1/challenges/{challenge_id}/hints"),
+            "files": self._request("get", f"/api/v1/challenges/{challenge_id}/files"),
+        }
+
+        changes = []
+
+        data = self._challenge_data(challenge)
+        changed = {
+            key: value
+            for key, value in data.items()
+            if remote["challenge"].get(key) != value
+        }
+        if changed:
+            changes.append(Change("update", "challenge", changed))
+
+        changes.extend(self._diff_parts(challenge, remote))
+        return changes
+
+    def apply(self, challenge_id: int, changes: List["Change"]):
+        for change in changes:
+            if change.kind == "challenge":
+                self._request(
+                    "patch", f"/api/v1/challenges/{challenge_id}", json=change.data
+                )
+            elif change.action == "add":
+                if change.kind == "file":
+                    self._upload_file(challenge_id, **change.data)
+                else:
+                    data = {"challenge": challenge_id, **change.data}
+                    endpoint = self.ENDPOINTS[change.kind]
+                    self._request("post", f"/api/v1/{endpoint}", json=data)
+            elif change.action == "remove":
+                endpoint = self.ENDPOINTS[change.kind]
+                self._request("delete", f"/api/v1/{endpoint}/{change.target}")
+                if change.kind == "file" and self.manifest is not None:
+                    self.manifest.forget(change.target)
+
+    def _upload_parts(self, challenge_id: int, challenge: Challenge):
+        self.apply(challenge_id, self._diff_parts(challenge, {}))
+
+    def _diff_parts(
+        self, challenge: Challenge, remote: Dict[str, Any]
+    ) -> List["Change"]:
+        additions = []
+        removals = []
+
+        # diff challenge flags
+        wanted = [self._flag_data(flag) for flag in challenge.flags]
+        for flag in remote.get("flags", []):
+            data = {"content": flag["content"], "type": flag["type"]}
+            if data in wanted:
+                wanted.remove(data)
+            else:
+                removals.append(Change("remove", "flag", flag["content"], flag["id"]))
+        additions.extend(Change("add", "flag", data) for data in wanted)
+
+        # diff challenge hints
+        wanted = [self._hint_data(hint) for hint in challenge.hints]
+        wanted = [data for data in wanted if data is not None]
+        for hint in remote.get("hints", []):
+            data = {"content": hint.get("content"), "cost": hint.get("cost")}
+            if data in wanted:
+                wanted.remove(data)
+            else:
+                removals.append(
+                    Change("remove", "hint", hint.get("content"), hint["id"])
+                )
+        additions.extend(Change("add", "hint", data) for data in wanted)
+
+        # diff challenge files
+        wanted = {}
+        if challenge.path:
+            for filename in challenge.files:
+                fullfilename = os.path.join(os.path.dirname(challenge.path), filename)
+                wanted[secure_filename(filename)] = {
+                    "filename": filename,
+                    "path": fullfilename,
+                    "sha1": hash_file(fullfilename),
+                }
+        for file in remote.get("files", []):
+            name = file["location"].split("/")[-1]
+            data = wanted.get(name)
+            if data is not None and self._file_unchanged(file, data["sha1"]):
+                del wanted[name]
+            else:
+                removals.append(Change("remove", "file", name, file["id"]))
+        additions.extend(Change("add", "file", data) for data in wanted.values())
+
+        # make additions before removals, so that a challenge is never left
+        # without any flags while it is being synced
+        return additions + removals
+
+    def _file_unchanged(self, remote: Dict[str, Any], sha1: Optional[str]) -> bool:
+        # newer versions of CTFd report the hash of uploaded files, otherwise
+        # fallback to what we remember uploading
+        sha1sum = remote.get("sha1sum")
+        if sha1sum is None and self.manifest is not None:
+            sha1sum = self.manifest.lookup(remote["id"], remote["location"])
+        return sha1sum is not None and sha1sum == sha1
+
+    def _upload_file(
+        self, challenge_id: int, filename: str, path: str, sha1: Optional[str] = None
+    ):
         data = {
+            "challenge": challenge_id,
+            "type": "challenge",
+        }
+        with MultipartStream(data, {"file": (filename, path)}) as body:
+            headers = {"Content-Type": body.content_type}
+            resp_data = self._request(
+                "post", "/api/v1/files", data=body, headers=headers
+            )
+
+        if self.manifest is not None and sha1 is not None:
+            for file in resp_data:
+                self.manifest.record(sha1, file["id"], file["location"])
+
+    def reset_bytes_sent(self):
+        self._local.bytes_sent = 0
+
+    def bytes_sent(self) -> int:
+        """
+        Number of request body bytes sent by the current thread since the
+        last call to reset_bytes_sent.
+        """
+
+        return getattr(self._local, "bytes_sent", 0)
+
+    def _request(self, method: str, path: str, **kwargs) -> Any:
+        import requests
+
+        kwargs.setdefault("timeout", self.timeout)
+
+        attempt = 0
+        while True:
+            if attempt > 0 and hasattr(kwargs.get("data"), "seek"):
+                kwargs["data"].seek(0)
+
+            start = time.perf_counter()
+            status = None
+            size = 0
+            try:
+                with self.concurrency:
+                    resp = self.session.request(
+                        method, f"{self.base}{path}", **kwargs
+                    )
+                status = resp.status_code
+
+                body = resp.request.body
+                if body is not None:
+                    size = len(body)
+                    self._local.bytes_sent = self.bytes_sent() + size
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not self._should_retry(method, attempt, error=e):
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if not self._should_retry(method, attempt, status=status):
+                    break
+                delay = self._backoff(attempt, resp.headers.get("Retry-After"))
+            finally:
+                self.metrics.record(
+                    method,
+                    path,
+                    status,
+                    start,
+                    time.perf_counter() - start,
+                    size,
+                    retries=1 if attempt > 0 else 0,
+                )
+
+            time.sleep(delay)
+            attempt += 1
+
+        resp.raise_for_status()
+        return resp.json().get("data")
+
+    def _should_retry(
+        self,
+        method: str,
+        attempt: int,
+        status: Optional[int] = None,
+        error: Optional[Exception] = None,
+    ) -> bool:
+        import requests
+
+        if attempt >= self.retries:
+            return False
+
+        if method.lower() in self.IDEMPOTENT_METHODS:
+            return error is not None or status in self.RETRY_STATUSES
+
+        # other requests might have been acted on, so only retry them if
+        # we're certain that the server didn't see them
+        if error is not None:
+            return isinstance(error, requests.exceptions.ConnectTimeout)
+        return status == 429
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        import random
+
+        if retry_after is not None:
+            delay = parse_retry_after(retry_after)
+            if delay is not None:
+                return min(delay, self.max_backoff)
+
+        # exponential backoff with "full jitter", so that parallel workers
+        # don't all retry at the same moment
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    @staticmethod
+    def _challenge_data(challenge: Challenge) -> Dict[str, Any]:
+        return {
             "name": challenge.display,
             "category": challenge.category,
             "state": challenge.state,
@@ -465,92 +2808,459 @@ class CTFd:
             "type": "standard",
             "description": challenge.description,
         }
-        resp = self.session.patch(
-            f"{self.base}/api/v1/challenges/{challenge_id}",
-            json=data,
-        )
-        resp.raise_for_status()
-        resp_data = resp.json()
 
-        self._remove_parts(challenge_id, challenge)
-        self._upload_parts(challenge_id, challenge)
+    @staticmethod
+    def _flag_data(flag: str) -> Dict[str, Any]:
+        if flag.startswith("/") and flag.endswith("/"):
+            return {"content": flag[1:-1], "type": "regex"}
+        else:
+            return {"content": flag, "type": "static"}
 
-        return challenge_id
+    @staticmethod
+    def _hint_data(hint: Any) -> Optional[Dict[str, Any]]:
+        if not isinstance(hint, dict):
+            return None
+        if "text" not in hint or "cost" not in hint:
+            return None
 
-    def _upload_parts(self, challenge_id: int, challenge: Challenge):
-        # add challenge flags
-        for flag in challenge.flags:
-            if flag.startswith("/") and flag.endswith("/"):
-                data = {
-                    "challenge": challenge_id,
-                    "content": flag[1:-1],
-                    "type": "regex",
+        return {"content": hint["text"], "cost": hint["cost"]}
+
+
+class Metrics:
+    """
+    Collects timings of the requests made to the CTFd server.
+
+    Requests are grouped by endpoint, with ids replaced by a placeholder, so
+    that (for example) all the flag uploads are summarized together.
+    """
+
+    BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self):
+        import threading
+
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+        self.requests = 0
+        self.endpoints: Dict[str, Dict[str, Any]] = {}
+        self.events: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def endpoint(method: str, path: str) -> str:
+        path = path.split("?")[0]
+        path = re.sub(r"/\d+(?=/|$)", "/{id}", path)
+        return f"{method.upper()} {path}"
+
+    def record(
+        self,
+        method: str,
+        path: str,
+        status: Optional[int],
+        start: float,
+        duration: float,
+        bytes_sent: int = 0,
+        retries: int = 0,
+    ):
+        import threading
+
+        endpoint = self.endpoint(method, path)
+        with self.lock:
+            self.requests += 1
+
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = {
+                    "latencies": [],
+                    "histogram": [0] * (len(self.BUCKETS) + 1),
+                    "bytes_sent": 0,
+                    "retries": 0,
+                    "errors": 0,
+                }
+                self.endpoints[endpoint] = stats
+
+            stats["latencies"].append(duration)
+            stats["histogram"][bisect.bisect_left(self.BUCKETS, duration)] += 1
+            stats["bytes_sent"] += bytes_sent
+            stats["retries"] += retries
+            if status is None or status >= 400:
+                stats["errors"] += 1
+
+            self.events.append(
+                {
+                    "name": endpoint,
+                    "cat": "request",
+                    "ph": "X",
+                    "ts": (start - self.origin) * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": {"path": path, "status": status, "bytes_sent": bytes_sent},
+                }
+            )
+
+    def summary(self) -> str:
+        header = (
+            "endpoint",
+            "count",
+            "total",
+            "p50",
+            "p90",
+            "max",
+            "sent",
+            "retry",
+            "err",
+        )
+        rows = []
+        with self.lock:
+            endpoints = sorted(
+                self.endpoints.items(), key=lambda item: -sum(item[1]["latencies"])
+            )
+            for endpoint, stats in endpoints:
+                latencies = sorted(stats["latencies"])
+                rows.append(
+                    (
+                        endpoint,
+                        str(len(latencies)),
+                        f"{sum(latencies):.2f}s",
+                        f"{percentile(latencies, 50) * 1000:.0f}ms",
+                        f"{percentile(latencies, 90) * 1000:.0f}ms",
+                        f"{latencies[-1] * 1000:.0f}ms",
+                        format_bytes(stats["bytes_sent"]),
+                        str(stats["retries"]),
+                        str(stats["errors"]),
+                    )
+                )
+
+        elapsed = time.perf_counter() - self.origin
+        lines = [f"{self.requests} requests in {elapsed:.2f}s"]
+        lines.extend(format_table(header, rows))
+        return "\n".join(lines)
+
+    def write_trace(self, filename: str):
+        with self.lock:
+            histograms = {
+                endpoint: {
+                    "buckets": self.BUCKETS,
+                    "counts": stats["histogram"],
                 }
+                for endpoint, stats in self.endpoints.items()
+            }
+            data = {
+                "traceEvents": self.events,
+                "displayTimeUnit": "ms",
+                "otherData": {"histograms": histograms},
+            }
+            with open(filename, "w") as f:
+                json.dump(data, f)
+
+
+def parse_retry_after(value: str) -> Optional[float]:
+    """
+    Parse a Retry-After header, which is either in seconds or a HTTP date.
+    """
+
+    import datetime
+    import email.utils
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+def format_table(header: Iterable[str], rows: List[Iterable[str]]) -> List[str]:
+    """
+    Align a table into lines, with the first column on the left and the rest
+    (usually numbers) on the right.
+    """
+
+    table = [list(header), *(list(row) for row in rows)]
+    widths = [max(len(row[i]) for row in table) for i in range(len(table[0]))]
+    lines = []
+    for row in table:
+        cells = [row[0].ljust(widths[0])]
+        cells.extend(cell.rjust(width) for cell, width in zip(row[1:], widths[1:]))
+        lines.append("  ".join(cells))
+    return lines
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            break
+        size /= 1024
+    return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+
+
+class Change:
+    """
+    A single write to be made to a challenge on the CTFd server.
+    """
+
+    def __init__(
+        self, action: str, kind: str, data: Any = None, target: Optional[int] = None
+    ):
+        self.action = action
+        self.kind = kind
+        self.data = data
+        self.target = target
+
+    def __str__(self) -> str:
+        if self.action == "create":
+            return f"+ {self.kind}"
+        elif self.action == "update":
+            return f"~ {self.kind} ({', '.join(self.data)})"
+        elif self.action == "add":
+            if self.kind == "file":
+                return f"+ {self.kind} {self.data['filename']}"
             else:
-                data = {"challenge": challenge_id, "content": flag, "type": "static"}
+                return f"+ {self.kind} {self.data['content']}"
+        else:
+            return f"- {self.kind} {self.data} (#{self.target})"
+
+    def __repr__(self) -> str:
+        return f"<Change {self}>"
 
-            resp = self.session.post(f"{self.base}/api/v1/flags", json=data)
-            resp.raise_for_status()
 
-        # add challenge hints
-        for hint in challenge.hints:
-            if not isinstance(hint, dict):
-                continue
-            if "text" not in hint or "cost" not in hint:
+class FileManifest:
+    """
+    Local record of the files uploaded to a CTFd instance.
+
+    Files are indexed by their sha1, and map to the id and location they
+    were given by the server, so that older CTFd versions (which don't report
+    file hashes) can still skip uploading unchanged files.
+    """
+
+    PATH = os.path.join(CACHE_DIR, "files.json")
+
+    def __init__(self, url: str, path: str = PATH):
+        import threading
+
+        self.url = url.rstrip("/")
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.data = read_cache(self.path)
+        self.files = self.data.setdefault(self.url, {})
+
+        self.index = {}
+        for sha1, uploads in self.files.items():
+            for file_id, location in uploads.items():
+                self.index[file_id] = (sha1, location)
+
+    def lookup(self, file_id: int, location: str) -> Optional[str]:
+        with self.lock:
+            sha1, known_location = self.index.get(str(file_id), (None, None))
+        if known_location != location:
+            return None
+        return sha1
+
+    def record(self, sha1: str, file_id: int, location: str):
+        with self.lock:
+            self.files.setdefault(sha1, {})[str(file_id)] = location
+            self.index[str(file_id)] = (sha1, location)
+
+    def forget(self, file_id: int):
+        with self.lock:
+            sha1, _ = self.index.pop(str(file_id), (None, None))
+            if sha1 is not None:
+                del self.files[sha1][str(file_id)]
+                if not self.files[sha1]:
+                    del self.files[sha1]
+
+    def save(self):
+        with self.lock:
+            write_cache(self.path, self.data, indent=2, sort_keys=True)
+
+
+class MultipartStream:
+    """
+    A multipart/form-data request body that streams files from disk.
+
+    requests reads the whole of any uploaded file into memory to build the
+    body, which is painful for large attachments - instead, this presents a
+    file-like object of known length that is read from in chunks.
+    """
+
+    def __init__(self, fields: Dict[str, Any], files: Dict[str, Tuple[str, str]]):
+        self.boundary = os.urandom(16).hex()
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+        self.parts: List[Tuple[Any, int]] = []
+        for name, value in fields.items():
+            self._add_bytes(
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'
+                f"{value}\r\n"
+            )
+        for name, (filename, path) in files.items():
+            self._add_bytes(
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{_quote(name)}"; '
+                f'filename="{_quote(filename)}"\r\n'
+                "Content-Type: application/octet-stream\r\n\r\n"
+            )
+            self.parts.append((path, os.path.getsize(path)))
+            self._add_bytes("\r\n")
+        self._add_bytes(f"--{self.boundary}--\r\n")
+
+        self.length = sum(length for _, length in self.parts)
+
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+        self._file = None
+
+    def _add_bytes(self, data: str):
+        encoded = data.encode()
+        self.parts.append((encoded, len(encoded)))
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        while size != 0 and self._index < len(self.parts):
+            part, length = self.parts[self._index]
+            want = length - self._offset
+            if size > 0:
+                want = min(want, size)
+
+            if isinstance(part, bytes):
+                chunk = part[self._offset : self._offset + want]
+            else:
+                if self._file is None:
+                    self._file = open(part, "rb")
+                chunk = self._file.read(want)
+                if len(chunk) != want:
+                    raise OSError(f'file "{part}" changed size during upload')
+
+            chunks.append(chunk)
+            self._offset += len(chunk)
+            self._position += len(chunk)
+            if size > 0:
+                size -= len(chunk)
+
+            if self._offset >= length:
+                self._close_file()
+                self._index += 1
+                self._offset = 0
+
+        return b"".join(chunks)
+
+    def seek(self, position: int):
+        if position != 0:
+            raise ValueError("can only seek to the start of the stream")
+        self._close_file()
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(1 << 16)
+            if not chunk:
+                break
+            yield chunk
+
+    def __enter__(self) -> "MultipartStream":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _quote(value: str) -> str:
+    # escape header values the same way browsers do
+    return value.replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+def hash_file(path: str) -> Optional[str]:
+    """
+    Compute the sha1 of a file in chunks, returning None if it can't be read.
+    """
+
+    import hashlib
+
+    sha1 = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                sha1.update(chunk)
+    except OSError:
+        return None
+    return sha1.hexdigest()
+
+
+def hash_directory(path: str, exclude: Iterable[str] = ()) -> str:
+    """
+    Compute a hash over the names and contents of all the files in a
+    directory, skipping any excluded files (relative to the directory).
+    """
+
+    import hashlib
+
+    exclude = {os.path.normpath(filename) for filename in exclude}
+
+    sha1 = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            fullfilename = os.path.join(root, filename)
+            relative = os.path.relpath(fullfilename, path)
+            if relative in exclude:
                 continue
 
-            data = {
-                "content": hint["text"],
-                "cost": hint["cost"],
-                "challenge": challenge_id,
-            }
-            resp = self.session.post(f"{self.base}/api/v1/hints", json=data)
-            resp.raise_for_status()
+            sha1.update(relative.encode() + b"\0")
+            sha1.update((hash_file(fullfilename) or "").encode() + b"\0")
+    return sha1.hexdigest()
 
-        # upload challenge files
-        if challenge.path:
-            for filename in challenge.files:
-                fullfilename = os.path.join(os.path.dirname(challenge.path), filename)
-                data = {
-                    "challenge": challenge_id,
-                    "type": "challenge",
-                }
-                files = {"file": (filename, open(fullfilename, "rb"))}
 
-                resp = self.session.post(
-                    f"{self.base}/api/v1/files",
-                    data=data,
-                    files=files,
-                )
-                resp.raise_for_status()
+def secure_filename(filename: str) -> str:
+    """
+    Mirror of werkzeug's secure_filename, which CTFd applies to uploads, so
+    that local filenames can be matched up with the uploaded files.
+    """
 
-    def _remove_parts(self, challenge_id: int, challenge: Challenge):
-        # remove challenge flags
-        resp = self.session.get(f"{self.base}/api/v1/challenges/{challenge_id}/flags")
-        resp.raise_for_status()
-        online_flags = resp.json()["data"]
-        for flag in online_flags:
-            self.session.delete(
-                f"{self.base}/api/v1/flags/{flag['id']}"
-            ).raise_for_status()
-
-        # remove challenge hints
-        resp = self.session.get(f"{self.base}/api/v1/challenges/{challenge_id}/hints")
-        resp.raise_for_status()
-        online_hints = resp.json()["data"]
-        for hint in online_hints:
-            self.session.delete(
-                f"{self.base}/api/v1/hints/{hint['id']}"
-            ).raise_for_status()
-
-        # remove challenge files
-        resp = self.session.get(f"{self.base}/api/v1/challenges/{challenge_id}/files")
-        resp.raise_for_status()
-        online_files = resp.json()["data"]
-        for file in online_files:
-            self.session.delete(
-                f"{self.base}/api/v1/files/{file['id']}"
-            ).raise_for_status()
+    filename = unicodedata.normalize("NFKD", filename)
+    filename = filename.encode("ascii", "ignore").decode("ascii")
+    for sep in (os.path.sep, os.path.altsep):
+        if sep:
+            filename = filename.replace(sep, " ")
+    filename = re.sub(r"[^A-Za-z0-9_.-]", "", "_".join(filename.split()))
+    return filename.strip("._")
 
 
 if __name__ == "__main__":
@@ -559,6 +3269,8 @@ if __name__ == "__main__":
     try:
         success = main()
     except Exception:
+        import traceback
+
         traceback.print_exc()
         success = False
     finally:
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
 import os
+import re
 import subprocess
+import sys
+import threading
+import time
 import yaml
 
 import ctftool
@@ -11,25 +16,317 @@ import ctftool
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--push", action="store_true")
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of images to build in parallel",
+    )
+    parser.add_argument(
+        "--push-jobs",
+        type=int,
+        default=2,
+        help="number of images to push in parallel",
+    )
+    parser.add_argument(
+        "--force",
+        "-f",
+        action="store_true",
+        help="rebuild images, even if they already exist for this commit",
+    )
+    parser.add_argument(
+        "--keep-going",
+        "-k",
+        action="store_true",
+        help="continue building other images after a failure",
+    )
     args = parser.parse_args()
 
-    for challenge in ctftool.Challenge.load_all():
+    challenges = list(ctftool.Challenge.load_all())
+    ctftool.Challenge.resolve_githashes(challenges)
+
+    builds = {}
+    for challenge in challenges:
         if challenge.deploy and challenge.deploy.docker:
-            print(f"Building from {challenge.path}...")
+            build = Build(challenge)
+            builds[build.image_name] = build
+    for build in builds.values():
+        build.dependencies = [
+            builds[image] for image in build.base_images() if image in builds
+        ]
+
+    scheduler = Scheduler(
+        builds.values(),
+        jobs=args.jobs,
+        push_jobs=args.push_jobs,
+        push=args.push,
+        force=args.force,
+        keep_going=args.keep_going,
+    )
+    scheduler.run()
+
+    print()
+    print("Summary:")
+    for build in builds.values():
+        print(f"  {build.summary()}")
+
+    failed = [build for build in builds.values() if build.failed]
+    if failed:
+        print()
+        print("Failed images:")
+        for build in failed:
+            print(f"  {build.image_name} ({build.status})")
+        sys.exit(1)
+
+
+class Build:
+    def __init__(self, challenge):
+        self.challenge = challenge
+        self.dependencies = []
+
+        image_name = f"challenge-{challenge.name}"
+        if (image_prefix := os.environ.get("IMAGE_PREFIX")):
+            image_name = f"{image_prefix}-{image_name}"
+        if (image_repo := os.environ.get("IMAGE_REPO")):
+            image_name = f"{image_repo}/{image_name}"
+        self.image_name = image_name
+
+        self.status = "pending"
+        self.timings = {}
+        self.log = []
+
+        # whether the image for this commit already exists
+        self.local = False
+        self.remote = False
+
+    @property
+    def directory(self):
+        return os.path.dirname(self.challenge.path)
+
+    @property
+    def tag(self):
+        return f"{self.image_name}:{self.challenge.githash}"
+
+    def base_images(self):
+        """
+        Find the images named by the FROM lines of the Dockerfile.
+        """
+
+        try:
+            with open(os.path.join(self.directory, "Dockerfile")) as f:
+                dockerfile = f.read()
+        except OSError:
+            return []
+
+        images = []
+        for match in re.finditer(
+            r"^\s*FROM\s+(?:--\S+\s+)*(\S+)", dockerfile, re.IGNORECASE | re.MULTILINE
+        ):
+            image = match.group(1).split("@")[0]
+            name, _, tag = image.rpartition(":")
+            if name and "/" not in tag:
+                image = name
+            images.append(image)
+        return images
+
+    @property
+    def unchanged(self):
+        return self.local or self.remote
+
+    def check(self, push=False):
+        """
+        Check whether the image has already been built for this commit,
+        either locally, or (if we'd need to push it) in the registry.
+        """
+
+        if self.challenge.githash is None:
+            return
+
+        self.local = self._succeeds("check", ["docker", "image", "inspect", self.tag])
+        if os.environ.get("IMAGE_REPO") and (push or not self.local):
+            self.remote = self._succeeds(
+                "check", ["docker", "manifest", "inspect", self.tag]
+            )
+
+    def build(self):
+        if self.local:
+            self._run("tag", ["docker", "tag", self.tag, f"{self.image_name}:latest"])
+            return
+        elif self.remote:
+            return
+
+        if os.environ.get("IMAGE_REPO"):
+            self._run("pull", ["docker", "pull", f"{self.image_name}:latest"], check=False)
+
+        self._run("build", ["docker", "build", "-t", self.tag, "."], cwd=self.directory)
+        self._run("tag", ["docker", "tag", self.tag, f"{self.image_name}:latest"])
+
+    def push(self):
+        if self.remote:
+            # retag in the registry, without needing the image locally
+            latest = f"{self.image_name}:latest"
+            command = ["docker", "buildx", "imagetools", "create", "--tag", latest]
+            if self._succeeds("push", [*command, self.tag]):
+                return
+
+            # buildx isn't available, so fallback to pulling the image
+            if not self.local:
+                self._run("pull", ["docker", "pull", self.tag])
+                self._run("tag", ["docker", "tag", self.tag, latest])
+            self._run("push", ["docker", "push", latest])
+            return
+
+        self._run("push", ["docker", "push", self.tag])
+        self._run("push", ["docker", "push", f"{self.image_name}:latest"])
+
+    @property
+    def built(self):
+        return self.status in ("pushing", "ok", "unchanged")
+
+    @property
+    def failed(self):
+        return not self.built and self.status not in ("pending", "building")
+
+    def timings_summary(self):
+        return ", ".join(
+            f"{step} {duration:.1f}s" for step, duration in self.timings.items()
+        )
+
+    def summary(self):
+        return f"{self.image_name:<40} {self.status:<20} {self.timings_summary()}"
+
+    def _run(self, step, command, check=True, **kwargs):
+        start = time.monotonic()
+        try:
+            proc = subprocess.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                **kwargs,
+            )
+        except OSError as e:
+            raise BuildError(f"{step} failed ({e})")
+        self.timings[step] = self.timings.get(step, 0) + time.monotonic() - start
+        self.log.append(proc.stdout)
+
+        if check and proc.returncode != 0:
+            raise BuildError(f"{step} failed")
+
+    def _succeeds(self, step, command):
+        start = time.monotonic()
+        try:
+            proc = subprocess.run(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except OSError:
+            return False
+        finally:
+            self.timings[step] = self.timings.get(step, 0) + time.monotonic() - start
+        return proc.returncode == 0
+
+
+class BuildError(RuntimeError):
+    pass
+
+
+class Scheduler:
+    """
+    Runs builds in parallel, only starting each build once the images it
+    depends on have been built.
+
+    Pushes run on their own, smaller, pool - they're limited by the
+    bandwidth to the registry, not by the local cores.
+    """
+
+    def __init__(
+        self, builds, jobs=1, push_jobs=1, push=False, force=False, keep_going=False
+    ):
+        self.builds = list(builds)
+        self.push = push
+        self.force = force
+        self.keep_going = keep_going
+
+        self.build_pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        self.push_pool = concurrent.futures.ThreadPoolExecutor(max_workers=push_jobs)
+        self.lock = threading.Lock()
+
+    def run(self):
+        pending = list(self.builds)
+        running = set()
+
+        while pending or running:
+            stopped = not self.keep_going and any(
+                build.failed for build in self.builds
+            )
+
+            for build in list(pending):
+                if stopped:
+                    build.status = "skipped"
+                    pending.remove(build)
+                elif any(dep.failed for dep in build.dependencies):
+                    build.status = "dependency failed"
+                    pending.remove(build)
+                elif all(dep.built for dep in build.dependencies):
+                    build.status = "building"
+                    pending.remove(build)
+                    running.add(self.build_pool.submit(self._build, build))
+
+            if pending and not running:
+                # nothing can make progress, so the rest must be a cycle
+                for build in pending:
+                    build.status = "dependency cycle"
+                pending.clear()
+
+            if running:
+                done, running = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    if (push := future.result()) is not None:
+                        running.add(push)
+
+        self.build_pool.shutdown()
+        self.push_pool.shutdown()
+
+    def _build(self, build):
+        if not self.force:
+            build.check(push=self.push)
+        if build.unchanged:
+            self._report(f"Skipping {build.image_name}, already built...")
+        else:
+            self._report(f"Building from {build.challenge.path}...")
+
+        try:
+            build.build()
+        except BuildError as e:
+            build.status = str(e)
+            self._report(f"Failed {build.image_name}: {e}\n" + "".join(build.log))
+            return None
+
+        if self.push:
+            build.status = "pushing"
+            return self.push_pool.submit(self._push, build)
 
-            image_name = f"challenge-{challenge.name}"
-            if (image_prefix := os.environ.get("IMAGE_PREFIX")):
-                image_name = f"{image_prefix}-{image_name}"
-            if (image_repo := os.environ.get("IMAGE_REPO")):
-                image_name = f"{image_repo}/{image_name}"
-                subprocess.run(["docker", "pull", f"{image_name}:latest"])
+        build.status = "unchanged" if build.unchanged else "ok"
+        self._report(f"Finished {build.image_name} ({build.timings_summary()})")
+        return None
 
-            subprocess.run(["docker", "build", "-t", f"{image_name}:{challenge.githash}", "."], cwd=os.path.dirname(challenge.path), check=True)
-            subprocess.run(["docker", "tag", f"{image_name}:{challenge.githash}", f"{image_name}:latest"], check=True)
+    def _push(self, build):
+        try:
+            build.push()
+        except BuildError as e:
+            build.status = str(e)
+            self._report(f"Failed {build.image_name}: {e}\n" + "".join(build.log))
+        else:
+            build.status = "unchanged" if build.unchanged else "ok"
+            self._report(f"Finished {build.image_name} ({build.timings_summary()})")
+        return None
 
-            if args.push:
-                subprocess.run(["docker", "push", f"{image_name}:{challenge.githash}"], check=True)
-                subprocess.run(["docker", "push", f"{image_name}:latest"], check=True)
+    def _report(self, message):
+        with self.lock:
+            print(message, flush=True)
 
 
 if __name__ == "__main__":
@@ -1,28 +1,167 @@
 #!/usr/bin/env python3
 
+import argparse
+import copy
+import glob
+import heapq
 import os
 import pathlib
 import site
+import sys
 import yaml
 
 import ctftool
 
+# fronts replicated challenges, since only one container can bind a host port
+BALANCER_IMAGE = "nginx:1.28-alpine"
+BALANCER_DIR = "balancers"
+
+# applied to every challenge container, so that one runaway (or malicious)
+# challenge can't exhaust the host
+PIDS_LIMIT = 512
+ULIMITS = {"nofile": {"soft": 4096, "hard": 4096}, "core": 0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="generate docker-compose services for the challenges"
+    )
+    parser.add_argument(
+        "--hosts",
+        type=int,
+        default=1,
+        help="number of hosts to spread the challenges across",
+    )
+    args = parser.parse_args(argv)
 
-def main():
     local = os.path.dirname(os.path.realpath(__file__))
 
-    services = {}
-    for challenge in ctftool.Challenge.load_all():
-        service = generate_service(challenge)
-        if service:
-            services = {**service, **services}
+    challenges = [
+        challenge
+        for challenge in ctftool.Challenge.load_all()
+        if challenge.deploy.docker
+    ]
+
+    collisions = find_collisions(challenges, reserved_ports(local))
+    if collisions:
+        for (external, protocol), names in sorted(collisions.items()):
+            print(
+                f"port {external}/{protocol} is used by {', '.join(names)}",
+                file=sys.stderr,
+            )
+        sys.exit(1)
+
+    shards = shard(challenges, max(args.hosts, 1))
+
+    if args.hosts <= 1:
+        filenames = ["docker-compose.override.yaml"]
+    else:
+        filenames = [f"docker-compose.host-{i}.yaml" for i in range(len(shards))]
+
+    composes = []
+    balancers = {}
+    for filename, shard_challenges in zip(filenames, shards):
+        services = {}
+        for challenge in shard_challenges:
+            services.update(generate_service(challenge))
+            if (balancer := generate_balancer(challenge)):
+                service, config = balancer
+                services.update(service)
+                balancers[f"challenge-{challenge.name}.conf"] = config
+        composes.append({"version": "3", "services": services})
+
+        weight = sum(challenge_weight(challenge) for challenge in shard_challenges)
+        if args.hosts > 1:
+            print(f"{filename}: {len(shard_challenges)} challenges, weight {weight}")
+
+    contents = ctftool.map_in_processes(ctftool.dump_yaml, composes)
+    for filename, content in zip(filenames, contents):
+        ctftool.write_if_changed(os.path.join(local, filename), content)
+
+    balancer_dir = os.path.join(local, BALANCER_DIR)
+    os.makedirs(balancer_dir, exist_ok=True)
+    for filename, content in balancers.items():
+        ctftool.write_if_changed(os.path.join(balancer_dir, filename), content)
+    for filename in os.listdir(balancer_dir):
+        if filename not in balancers:
+            os.remove(os.path.join(balancer_dir, filename))
+
+    # remove files from a previous run with a different number of hosts,
+    # which docker-compose would otherwise still pick up
+    stale = glob.glob(os.path.join(local, "docker-compose.host-*.yaml"))
+    stale.append(os.path.join(local, "docker-compose.override.yaml"))
+    for path in stale:
+        if os.path.basename(path) not in filenames and os.path.exists(path):
+            os.remove(path)
+
+
+def challenge_weight(challenge):
+    """
+    Estimate how much of a host a challenge takes up, by the number of
+    containers (and exposed ports) it needs.
+    """
+
+    return max(replicas(challenge), 1) * max(len(challenge.deploy.ports), 1)
+
+
+def replicas(challenge):
+    # compose can't autoscale, so provision for the peak instead
+    if challenge.deploy.autoscale:
+        return challenge.deploy.autoscale.max
+    return challenge.deploy.replicas
+
+
+def shard(challenges, hosts):
+    """
+    Spread challenges across hosts, balancing their total weights.
+
+    This is the greedy longest-processing-time heuristic: the heaviest
+    challenges are placed first, each onto the currently lightest host. Ties
+    are broken by name, so that the output is stable between runs.
+    """
+
+    shards = [[] for _ in range(hosts)]
+    heap = [(0, i) for i in range(hosts)]
+    order = sorted(challenges, key=lambda c: (-challenge_weight(c), c.name))
+    for challenge in order:
+        weight, i = heapq.heappop(heap)
+        shards[i].append(challenge)
+        heapq.heappush(heap, (weight + challenge_weight(challenge), i))
+
+    for challenges in shards:
+        challenges.sort(key=lambda c: c.name)
+    return shards
+
 
-    with open(os.path.join(local, "docker-compose.override.yaml"), "w") as f:
-        compose = {
-            "version": "3",
-            "services": services,
-        }
-        yaml.dump(compose, f)
+def reserved_ports(local):
+    """
+    Find the host ports already taken by the base docker-compose.yaml.
+    """
+
+    try:
+        with open(os.path.join(local, "docker-compose.yaml")) as f:
+            base = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        return {}
+
+    reserved = {}
+    for name, service in (base.get("services") or {}).items():
+        for port in service.get("ports") or []:
+            # short syntax, like "80:80" or "127.0.0.1:8000:8000/udp"
+            mapping, _, protocol = str(port).partition("/")
+            parts = mapping.split(":")
+            if len(parts) >= 2 and parts[-2].isdigit():
+                reserved[int(parts[-2]), protocol or "tcp"] = name
+    return reserved
+
+
+def find_collisions(challenges, reserved):
+    users = {key: [name] for key, name in reserved.items()}
+    for challenge in challenges:
+        for port in challenge.deploy.ports:
+            key = (port.external, port.protocol.lower())
+            users.setdefault(key, []).append(f"challenge-{challenge.name}")
+    return {key: names for key, names in users.items() if len(names) > 1}
 
 
 def generate_service(challenge):
@@ -38,19 +177,122 @@ def generate_service(challenge):
     result = {
         "image": image_name,
         "restart": "unless-stopped",
+        "pids_limit": PIDS_LIMIT,
+        # copied, so that the yaml doesn't fill up with aliases
+        "ulimits": copy.deepcopy(ULIMITS),
     }
     if challenge.deploy.env:
         result["environment"] = {key: f"${key}" for key in challenge.deploy.env}
     if challenge.deploy.ports:
-        ports = []
-        for port in challenge.deploy.ports:
-            ports.append(f"{port.external}:{port.internal}/{port.protocol}")
-        result["ports"] = ports
+        if replicas(challenge) > 1:
+            # published through the balancer instead
+            result["expose"] = [
+                f"{port.internal}/{port.protocol}" for port in challenge.deploy.ports
+            ]
+        else:
+            ports = []
+            for port in challenge.deploy.ports:
+                ports.append(f"{port.external}:{port.internal}/{port.protocol}")
+            result["ports"] = ports
+
+    deploy = {}
+    if replicas(challenge) != 1:
+        deploy["replicas"] = replicas(challenge)
+    if (resources := generate_resources(challenge.deploy.resources)):
+        deploy["resources"] = resources
+    if deploy:
+        result["deploy"] = deploy
 
     return {
         f"challenge-{challenge.name}": result,
     }
 
 
+def generate_resources(resources):
+    """
+    Convert kubernetes-style resources into compose limits and reservations.
+    """
+
+    if not resources:
+        return None
+
+    result = {}
+    for kind, values in (
+        ("limits", resources.limits),
+        ("reservations", resources.requests),
+    ):
+        converted = {}
+        if "cpu" in values:
+            cpus = ctftool.parse_quantity(values["cpu"])
+            converted["cpus"] = f"{cpus:g}"
+        if "memory" in values:
+            converted["memory"] = int(ctftool.parse_quantity(values["memory"]))
+        if converted:
+            result[kind] = converted
+    return result
+
+
+def generate_balancer(challenge):
+    """
+    Generate a TCP/UDP load balancer for a replicated challenge, along with
+    its nginx config.
+
+    Replicas can't share a host port, so the balancer publishes the
+    external ports instead, spreading connections across every replica
+    (which it re-resolves through docker's DNS as replicas come and go).
+    """
+
+    if not challenge.deploy.docker or replicas(challenge) <= 1:
+        return None
+    if not challenge.deploy.ports:
+        return None
+
+    name = f"challenge-{challenge.name}"
+    lines = [
+        "worker_processes auto;",
+        "",
+        "events {",
+        "    worker_connections 4096;",
+        "}",
+        "",
+        "stream {",
+        "    # docker's embedded dns server",
+        "    resolver 127.0.0.11 valid=10s;",
+    ]
+    ports = []
+    for port in challenge.deploy.ports:
+        upstream = f"port_{port.external}_{port.protocol.lower()}"
+        listen = str(port.external)
+        if port.protocol.lower() == "udp":
+            listen += " udp"
+        lines += [
+            "",
+            f"    upstream {upstream} {{",
+            f"        zone {upstream} 64k;",
+            "        least_conn;",
+            f"        server {name}:{port.internal} resolve;",
+            "    }",
+            "",
+            "    server {",
+            f"        listen {listen};",
+            f"        proxy_pass {upstream};",
+            "    }",
+        ]
+        ports.append(f"{port.external}:{port.external}/{port.protocol}")
+    lines.append("}")
+    config = "\n".join(lines) + "\n"
+
+    service = {
+        "image": BALANCER_IMAGE,
+        "restart": "unless-stopped",
+        "depends_on": [name],
+        "ports": ports,
+        "volumes": [
+            f"./{BALANCER_DIR}/{name}.conf:/etc/nginx/nginx.conf:ro",
+        ],
+    }
+    return {f"{name}-lb": service}, config
+
+
 if __name__ == "__main__":
     main()
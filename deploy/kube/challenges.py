@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 
+import hashlib
+import json
 import os
 import site
-import yaml
 
 import ctftool
 
+# records what was last generated, so that removed challenges can be cleaned up
+MANIFEST = ".manifest.json"
+
+# below this many challenges, rendering in worker processes isn't worth it
+PARALLEL_THRESHOLD = 64
+
 
 def main():
     local = os.path.dirname(os.path.realpath(__file__))
@@ -13,26 +20,104 @@ def main():
     os.makedirs(os.path.join(local), exist_ok=True)
 
     challenges = list(ctftool.Challenge.load_all())
+    ctftool.Challenge.resolve_githashes(challenges)
+
+    manifest_path = os.path.join(local, MANIFEST)
+    previous = ctftool.read_cache(manifest_path).get("files", {})
+    manifest = {}
+
+    # skip rendering challenges whose inputs haven't changed since last time,
+    # as long as their output is still intact
+    generator = ctftool.hash_file(os.path.realpath(__file__))
+    pending = []
     for challenge in challenges:
         if not challenge.deploy.docker:
             continue
 
-        deploy = generate_deployment(challenge)
-        service = generate_service(challenge)
+        filename = challenge.name + ".yaml"
+        key = render_key(challenge, generator)
+        entry = previous.get(filename) or {}
+        path = os.path.join(local, filename)
+        if entry.get("key") == key and ctftool.hash_file(path) == entry.get("sha1"):
+            manifest[filename] = entry
+        else:
+            pending.append((challenge, key))
+
+    rendered = render_all([challenge for challenge, _ in pending])
+    for (challenge, key), (filename, content) in zip(pending, rendered):
+        manifest[filename] = {
+            "key": key,
+            "sha1": write(local, filename, content),
+            "challenge": challenge.name,
+            "githash": challenge.githash,
+        }
+
+    # the kustomization is cheap, and has secrets substituted into it after
+    # generation, so always render it
+    kustomization = generate_kustomization(challenges)
+    content = ctftool.dump_yaml(kustomization) if kustomization else ""
+    manifest["kustomization.yaml"] = {
+        "key": None,
+        "sha1": write(local, "kustomization.yaml", content),
+    }
+
+    # clean up after challenges that have been removed (or undeployed)
+    for filename in previous.keys() - manifest.keys():
+        try:
+            os.remove(os.path.join(local, filename))
+            print(f"removed {filename}")
+        except FileNotFoundError:
+            pass
+
+    ctftool.write_cache(manifest_path, {"files": manifest}, indent=2, sort_keys=True)
+
+
+def render_key(challenge, generator):
+    """
+    Identify everything that a challenge's rendered manifests depend on.
+    """
+
+    inputs = [
+        challenge.to_dict(),
+        challenge.githash,
+        os.environ.get("IMAGE_PREFIX"),
+        os.environ.get("IMAGE_REPO"),
+        generator,
+    ]
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
 
-        with open(os.path.join(local, challenge.name) + ".yaml", "w") as f:
-            if service:
-                yaml.dump(service, f)
-                print("---", file=f)
+def write(local, filename, content):
+    if ctftool.write_if_changed(os.path.join(local, filename), content):
+        print(f"updated {filename}")
+    return hashlib.sha1(content.encode()).hexdigest()
 
-            if deploy:
-                yaml.dump(deploy, f)
-                print("---", file=f)
 
-    with open(os.path.join(local, "kustomization.yaml"), "w") as f:
-        kustomization = generate_kustomization(challenges)
-        if kustomization:
-            yaml.dump(kustomization, f)
+def render_all(challenges):
+    """
+    Render the manifests for each challenge, in worker processes if there
+    are enough of them.
+    """
+
+    return ctftool.map_in_processes(
+        render, challenges, threshold=PARALLEL_THRESHOLD, chunksize=16
+    )
+
+
+def render(challenge):
+    content = ""
+    service = generate_service(challenge)
+    if service:
+        content += ctftool.dump_yaml(service) + "---\n"
+    for generate in (
+        generate_deployment,
+        generate_autoscaler,
+        generate_disruption_budget,
+    ):
+        resource = generate(challenge)
+        if resource:
+            content += ctftool.dump_yaml(resource) + "---\n"
+    return challenge.name + ".yaml", content
 
 
 def generate_kustomization(challenges):
@@ -98,6 +183,34 @@ def generate_deployment(challenge):
     if env:
         container["env"] = env
 
+    resources = challenge.deploy.resources
+    if resources:
+        container["resources"] = {
+            kind: values for kind, values in resources.to_dict().items() if values
+        }
+    if challenge.deploy.readiness:
+        container["readinessProbe"] = generate_probe(challenge.deploy.readiness)
+    if challenge.deploy.liveness:
+        container["livenessProbe"] = generate_probe(challenge.deploy.liveness)
+
+    spec = {
+        "selector": {"matchLabels": {"challenge": challenge.name}},
+        "template": {
+            "metadata": {
+                "name": f"challenge-{challenge.name}",
+                "labels": {"app": "challenge", "challenge": challenge.name},
+            },
+            "spec": {
+                "automountServiceAccountToken": False,
+                "containers": [container],
+            },
+        },
+    }
+    if not challenge.deploy.autoscale:
+        # leave the replicas to the autoscaler otherwise, so that applying
+        # this doesn't reset them
+        spec["replicas"] = challenge.deploy.replicas
+
     return {
         "apiVersion": "apps/v1",
         "kind": "Deployment",
@@ -105,19 +218,73 @@ def generate_deployment(challenge):
             "name": f"challenge-{challenge.name}-deployment",
             "labels": {"app": "challenge", "challenge": challenge.name},
         },
+        "spec": spec,
+    }
+
+
+def generate_probe(probe):
+    if probe.path:
+        action = {"httpGet": {"path": probe.path, "port": probe.port}}
+    else:
+        action = {"tcpSocket": {"port": probe.port}}
+    return {
+        **action,
+        "initialDelaySeconds": probe.delay,
+        "periodSeconds": probe.period,
+    }
+
+
+def generate_autoscaler(challenge):
+    autoscale = challenge.deploy.autoscale
+    if not challenge.deploy.docker or not autoscale:
+        return None
+
+    return {
+        "apiVersion": "autoscaling/v2",
+        "kind": "HorizontalPodAutoscaler",
+        "metadata": {
+            "name": f"challenge-{challenge.name}-autoscaler",
+            "labels": {"challenge": challenge.name},
+        },
         "spec": {
-            "replicas": challenge.deploy.replicas,
-            "selector": {"matchLabels": {"challenge": challenge.name}},
-            "template": {
-                "metadata": {
-                    "name": f"challenge-{challenge.name}",
-                    "labels": {"app": "challenge", "challenge": challenge.name},
-                },
-                "spec": {
-                    "automountServiceAccountToken": False,
-                    "containers": [container],
-                },
+            "scaleTargetRef": {
+                "apiVersion": "apps/v1",
+                "kind": "Deployment",
+                "name": f"challenge-{challenge.name}-deployment",
             },
+            "minReplicas": autoscale.min,
+            "maxReplicas": autoscale.max,
+            "metrics": [
+                {
+                    "type": "Resource",
+                    "resource": {
+                        "name": "cpu",
+                        "target": {
+                            "type": "Utilization",
+                            "averageUtilization": autoscale.target,
+                        },
+                    },
+                }
+            ],
+        },
+    }
+
+
+def generate_disruption_budget(challenge):
+    # a budget for a single replica would only ever block node drains
+    if not challenge.deploy.docker or challenge.deploy.min_replicas < 2:
+        return None
+
+    return {
+        "apiVersion": "policy/v1",
+        "kind": "PodDisruptionBudget",
+        "metadata": {
+            "name": f"challenge-{challenge.name}-budget",
+            "labels": {"challenge": challenge.name},
+        },
+        "spec": {
+            "maxUnavailable": 1,
+            "selector": {"matchLabels": {"challenge": challenge.name}},
         },
     }
 
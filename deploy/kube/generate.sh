@@ -8,5 +8,10 @@ $BASE/challenges.py
 
 for filename in $BASE/**/*.yaml; do
     envsubst < $filename > $filename.tmp
-    mv $filename.tmp $filename
+    # leave unchanged files alone, so that only real changes are applied
+    if cmp -s $filename $filename.tmp; then
+        rm $filename.tmp
+    else
+        mv $filename.tmp $filename
+    fi
 done
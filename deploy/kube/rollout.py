@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import yaml
+
+import ctftool
+
+LOCAL = os.path.dirname(os.path.realpath(__file__))
+CHALLENGES = os.path.join(LOCAL, "challenges")
+ROLLOUT = os.path.join(LOCAL, "rollout")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="deploy only the challenges changed since the last rollout"
+    )
+    parser.add_argument(
+        "--configmap",
+        default="challenge-rollout",
+        help="configmap recording what was last rolled out",
+    )
+    parser.add_argument(
+        "--namespace", "-n", help="namespace to deploy to (and keep the configmap in)"
+    )
+    parser.add_argument(
+        "--state",
+        metavar="FILE",
+        help="record what was last rolled out in a local file instead",
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="roll out every challenge, changed or not"
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="apply the rollout with kubectl, and record it if successful",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="delete the workloads of challenges that no longer exist",
+    )
+    args = parser.parse_args()
+
+    if args.state:
+        store = FileStore(args.state)
+    else:
+        store = ConfigMapStore(args.configmap, args.namespace)
+
+    current = current_state()
+    previous = {} if args.all else store.load()
+
+    changed = [
+        name
+        for name, entry in current.items()
+        if previous.get(name, {}).get("sha1") != entry["sha1"]
+    ]
+    removed = [name for name in previous if name not in current]
+
+    for name in changed:
+        githash = current[name]["githash"]
+        if name in previous:
+            print(f"~ {name} ({previous[name].get('githash')} -> {githash})")
+        else:
+            print(f"+ {name} ({githash})")
+    for name in removed:
+        print(f"- {name}")
+    if not changed and not removed:
+        print("nothing to roll out")
+
+    write_rollout(changed)
+
+    if not args.apply:
+        return
+
+    # everything goes to the same namespace as the configmap, so that the
+    # record always matches what's actually deployed
+    if changed:
+        kubectl(["apply", "-k", ROLLOUT], args.namespace)
+    if args.prune:
+        for name in removed:
+            kubectl(
+                [
+                    "delete",
+                    "deployment,service,horizontalpodautoscaler,poddisruptionbudget",
+                    "--selector",
+                    f"challenge={name}",
+                    "--ignore-not-found",
+                ],
+                args.namespace,
+            )
+    else:
+        # keep tracking removed challenges, so that a later --prune can
+        # still find them
+        current = {**{name: previous[name] for name in removed}, **current}
+
+    store.save(current)
+
+
+def current_state():
+    """
+    Fingerprint each generated challenge, from its manifests and secrets.
+
+    This must run after generate.sh, so that the secrets have already been
+    substituted in (and so changing a secret also causes a rollout).
+    """
+
+    manifest = ctftool.read_cache(os.path.join(CHALLENGES, ".manifest.json"))
+    secrets = {secret["name"]: secret for secret in load_secrets()}
+
+    state = {}
+    for filename, entry in manifest.get("files", {}).items():
+        name = entry.get("challenge")
+        if name is None:
+            continue
+
+        sha1 = hashlib.sha1()
+        digest = ctftool.hash_file(os.path.join(CHALLENGES, filename))
+        sha1.update((digest or "").encode())
+        secret = secrets.get(f"challenge-{name}-secret")
+        if secret is not None:
+            sha1.update(json.dumps(secret, sort_keys=True).encode())
+
+        state[name] = {
+            "filename": filename,
+            "githash": entry.get("githash"),
+            "sha1": sha1.hexdigest(),
+        }
+    return state
+
+
+def load_secrets():
+    try:
+        with open(os.path.join(CHALLENGES, "kustomization.yaml")) as f:
+            kustomization = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        return []
+    return kustomization.get("secretGenerator") or []
+
+
+def write_rollout(names):
+    """
+    Write a kustomization containing only the given challenges (and their
+    secrets, so that kustomize can still link them to their deployments).
+    """
+
+    shutil.rmtree(ROLLOUT, ignore_errors=True)
+    os.makedirs(ROLLOUT)
+
+    wanted = {f"challenge-{name}-secret" for name in names}
+    resources = []
+    for name in names:
+        filename = name + ".yaml"
+        shutil.copyfile(
+            os.path.join(CHALLENGES, filename), os.path.join(ROLLOUT, filename)
+        )
+        resources.append(filename)
+
+    with open(os.path.join(ROLLOUT, "kustomization.yaml"), "w") as f:
+        kustomization = {
+            "apiVersion": "kustomize.config.k8s.io/v1beta1",
+            "kind": "Kustomization",
+            "resources": resources,
+            "secretGenerator": [
+                secret for secret in load_secrets() if secret["name"] in wanted
+            ],
+        }
+        yaml.safe_dump(kustomization, f)
+
+
+def kubectl(command, namespace=None, **kwargs):
+    if namespace:
+        command = ["--namespace", namespace, *command]
+    try:
+        return subprocess.run(["kubectl", *command], check=True, **kwargs)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"kubectl {' '.join(command)} failed ({e})", file=sys.stderr)
+        sys.exit(1)
+
+
+class FileStore:
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        return ctftool.read_cache(self.path).get("challenges", {})
+
+    def save(self, state):
+        with open(self.path, "w") as f:
+            json.dump({"challenges": state}, f, indent=2, sort_keys=True)
+
+
+class ConfigMapStore:
+    """
+    Keeps the rollout state in the cluster, next to the challenges, so that
+    every (otherwise stateless) CI job sees the same history.
+    """
+
+    KEY = "state.json"
+
+    def __init__(self, name, namespace=None):
+        self.name = name
+        self.namespace = namespace
+
+    def load(self):
+        command = ["get", "configmap", self.name, "-o", "json"]
+        if self.namespace:
+            command = ["--namespace", self.namespace, *command]
+        try:
+            proc = subprocess.run(
+                ["kubectl", *command],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+        except OSError as e:
+            print(f"kubectl {' '.join(command)} failed ({e})", file=sys.stderr)
+            sys.exit(1)
+        if proc.returncode != 0:
+            if "NotFound" in proc.stderr:
+                # never rolled out before
+                return {}
+            print(proc.stderr, end="", file=sys.stderr)
+            sys.exit(1)
+
+        data = json.loads(proc.stdout).get("data") or {}
+        try:
+            return json.loads(data.get(self.KEY, "{}")).get("challenges", {})
+        except ValueError:
+            return {}
+
+    def save(self, state):
+        configmap = {
+            "apiVersion": "v1",
+            "kind": "ConfigMap",
+            "metadata": {"name": self.name},
+            "data": {self.KEY: json.dumps({"challenges": state}, sort_keys=True)},
+        }
+        kubectl(
+            ["apply", "-f", "-"],
+            self.namespace,
+            input=json.dumps(configmap),
+            text=True,
+        )
+
+
+if __name__ == "__main__":
+    main()